@@ -95,3 +95,242 @@ def arr_df():
     path = pre.join_cwd('data/cmi.csv')
     return pre.read_csv(path, date='valid', skiprows=5,
                         spawn_dates=True, spawn_times=True)
+
+
+def _get_synth_coords(ntimes=365, nlvls=1, nlats=73, nlons=144,
+                      start='2000-01-01', freq='D'):
+    """
+    Create the coordinates of a synthetic (time, lvl, lat, lon) dataset
+
+    :param ntimes: (int) - number of time steps
+    :param nlvls: (int) - number of pressure levels, from 1000 to 100 hPa
+    :param nlats: (int) - number of latitudes, from 90 to -90
+    :param nlons: (int) - number of longitudes, from 0 to 360 (exclusive)
+    :param start: (str) - date to start
+    :param freq: (str) - frequency of time step
+    :return coords: (dict) - time, lvl, lat, lon
+    """
+    if nlvls > 1:
+        lvls = np.linspace(1000., 100., nlvls)
+    else:
+        lvls = np.array([1000.])
+    return {'time': pd.date_range(start, periods=ntimes, freq=freq),
+            'lvl': lvls,
+            'lat': np.linspace(90., -90., nlats),
+            'lon': np.linspace(0., 360., nlons, endpoint=False)}
+
+
+def _get_synth_block(coords, start, stop, seed=0, missing=0.01, fill=0.,
+                     fillval=-9999., dtype='float32'):
+    """
+    Create time steps start:stop of a synthetic temperature-like field
+    with a latitudinal gradient, lapse rate, stationary waves, seasonal
+    and diurnal cycles and noise; each time step is seeded by its own
+    index so any chunking yields identical values.
+
+    :param coords: (dict) - output of _get_synth_coords
+    :param start: (int) - index of first time step
+    :param stop: (int) - index after the last time step
+    :param seed: (int) - repeat random values
+    :param missing: (float) - fraction of values set to NaN
+    :param fill: (float) - fraction of values set to fillval
+    :param fillval: (float) - fill value
+    :param dtype: (str) - data type of the values
+    :return block: (np.array) - values of shape (time, lvl, lat, lon)
+    """
+    times = coords['time'][start:stop]
+    lvls = coords['lvl'][:, None, None]
+    lats = np.deg2rad(coords['lat'])[:, None]
+    lons = np.deg2rad(coords['lon'])
+
+    heights = np.minimum(-7000. * np.log(lvls / 1000.), 11000.)
+    clim = (300. - 45. * np.sin(lats) ** 2 - 0.0065 * heights +
+            3. * np.cos(2 * lons) * np.cos(lats))
+
+    doys = np.asarray(times.dayofyear, dtype=float)
+    seas = -np.cos(2 * np.pi * (doys - 15.) / 365.25)
+    hours = (np.asarray(times.hour, dtype=float)[:, None] +
+             np.rad2deg(lons) / 15.)
+    diurnal = np.cos(2 * np.pi * (hours - 15.) / 24.)
+
+    block = np.empty((len(times),) + clim.shape, dtype=dtype)
+    for i in range(len(times)):
+        rng = np.random.RandomState([seed, start + i])
+        block[i] = (clim + 15. * np.sin(lats) * seas[i] +
+                    4. * (lvls / 1000.) ** 4 * diurnal[i] +
+                    2. * rng.standard_normal(block.shape[1:]))
+        if missing > 0 or fill > 0:
+            draw = rng.random_sample(block.shape[1:])
+            block[i][draw < missing] = np.nan
+            block[i][(draw >= missing) & (draw < missing + fill)] = fillval
+    return block
+
+
+def iter_synth(ntimes=365, nlvls=1, nlats=73, nlons=144,
+               start='2000-01-01', freq='D', chunk=None, seed=0,
+               missing=0.01, fill=0., fillval=-9999., dtype='float32'):
+    """
+    Create a synthetic (time, lvl, lat, lon) dataset chunk by chunk so
+    that it never has to fit in memory
+
+    :param ntimes: (int) - number of time steps
+    :param nlvls: (int) - number of pressure levels
+    :param nlats: (int) - number of latitudes
+    :param nlons: (int) - number of longitudes
+    :param start: (str) - date to start
+    :param freq: (str) - frequency of time step
+    :param chunk: (int) - number of time steps per chunk (~80 MB default)
+    :param seed: (int) - repeat random values
+    :param missing: (float) - fraction of values set to NaN
+    :param fill: (float) - fraction of values set to fillval
+    :param fillval: (float) - fill value
+    :param dtype: (str) - data type of the values
+    :return slc, block: (slice, np.array) - time slice and its values
+    """
+    coords = _get_synth_coords(ntimes=ntimes, nlvls=nlvls, nlats=nlats,
+                               nlons=nlons, start=start, freq=freq)
+    if chunk is None:
+        step_size = nlvls * nlats * nlons * np.dtype(dtype).itemsize
+        chunk = max(1, int(8e7 // step_size))
+    for i in range(0, ntimes, chunk):
+        stop = min(i + chunk, ntimes)
+        yield slice(i, stop), _get_synth_block(coords, i, stop, seed=seed,
+                                               missing=missing, fill=fill,
+                                               fillval=fillval, dtype=dtype)
+
+
+def write_synth(path, ntimes=365, nlvls=1, nlats=73, nlons=144,
+                start='2000-01-01', freq='D', chunk=None, seed=0,
+                missing=0.01, fill=0., fillval=-9999., dtype='float32',
+                var='tmp', zlib=False):
+    """
+    Write a synthetic (time, lvl, lat, lon) dataset chunk by chunk to a
+    netCDF file (.nc) or a memory-mapped numpy file (.npy)
+
+    :param path: (str) - path to output file, ending in .nc or .npy
+    :param ntimes: (int) - number of time steps
+    :param nlvls: (int) - number of pressure levels
+    :param nlats: (int) - number of latitudes
+    :param nlons: (int) - number of longitudes
+    :param start: (str) - date to start
+    :param freq: (str) - frequency of time step
+    :param chunk: (int) - number of time steps written at once
+    :param seed: (int) - repeat random values
+    :param missing: (float) - fraction of values set to NaN
+    :param fill: (float) - fraction of values set to fillval
+    :param fillval: (float) - fill value
+    :param dtype: (str) - data type of the values
+    :param var: (str) - name of variable if netCDF
+    :param zlib: (boolean) - whether to compress if netCDF
+    :return path: (str) - path to output file
+    """
+    kwargs = dict(ntimes=ntimes, nlvls=nlvls, nlats=nlats, nlons=nlons,
+                  start=start, freq=freq, chunk=chunk, seed=seed,
+                  missing=missing, fill=fill, fillval=fillval, dtype=dtype)
+    shape = (ntimes, nlvls, nlats, nlons)
+
+    if path.endswith('.npy'):
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                        shape=shape)
+        for slc, block in iter_synth(**kwargs):
+            out[slc] = block
+        out.flush()
+        del out
+        return path
+
+    from netCDF4 import Dataset, date2num
+
+    coords = _get_synth_coords(ntimes=ntimes, nlvls=nlvls, nlats=nlats,
+                               nlons=nlons, start=start, freq=freq)
+    units = 'hours since {0:%Y-%m-%d %H:%M:%S}'.format(coords['time'][0])
+    with Dataset(path, mode='w') as fi_out:
+        fi_out.createDimension('time', None)
+        for dim in ['lvl', 'lat', 'lon']:
+            fi_out.createDimension(dim, len(coords[dim]))
+
+        time_var = fi_out.createVariable('time', 'f8', ('time',))
+        time_var.units = units
+        time_var.calendar = 'standard'
+        time_var[:] = date2num(coords['time'].to_pydatetime(), units,
+                               calendar='standard')
+        for dim, dim_units in [('lvl', 'hPa'), ('lat', 'degrees_north'),
+                               ('lon', 'degrees_east')]:
+            dim_var = fi_out.createVariable(dim, 'f4', (dim,))
+            dim_var.units = dim_units
+            dim_var[:] = coords[dim]
+
+        data_var = fi_out.createVariable(var, dtype,
+                                         ('time', 'lvl', 'lat', 'lon'),
+                                         fill_value=fillval, zlib=zlib,
+                                         chunksizes=(1, 1, nlats, nlons))
+        data_var.units = 'K'
+        data_var.missing_value = np.array(fillval, dtype=dtype)
+        data_var.set_auto_mask(False)
+        for slc, block in iter_synth(**kwargs):
+            data_var[slc] = block
+    return path
+
+
+def arr_synth(ntimes=365, nlvls=1, nlats=73, nlons=144,
+              start='2000-01-01', freq='D', chunk=None, seed=0,
+              missing=0.01, fill=0., fillval=-9999., dtype='float32',
+              var='tmp', path=None, lazy=False):
+    """
+    Create a seeded synthetic (time, lvl, lat, lon) temperature dataset
+    of any size; pass a path to write it chunk by chunk first and open it
+    lazily, or lazy to build it with dask (if installed)
+
+    :param ntimes: (int) - number of time steps
+    :param nlvls: (int) - number of pressure levels
+    :param nlats: (int) - number of latitudes
+    :param nlons: (int) - number of longitudes
+    :param start: (str) - date to start
+    :param freq: (str) - frequency of time step
+    :param chunk: (int) - number of time steps per chunk
+    :param seed: (int) - repeat random values
+    :param missing: (float) - fraction of values set to NaN
+    :param fill: (float) - fraction of values set to fillval
+    :param fillval: (float) - fill value
+    :param dtype: (str) - data type of the values
+    :param var: (str) - name of variable
+    :param path: (str) - .nc or .npy file to write to and open from
+    :param lazy: (boolean) - whether to return a dask-backed dataset
+    :return ds: (xr.Dataset/np.memmap) - dataset (memmap if .npy path)
+    """
+    kwargs = dict(ntimes=ntimes, nlvls=nlvls, nlats=nlats, nlons=nlons,
+                  start=start, freq=freq, chunk=chunk, seed=seed,
+                  missing=missing, fill=fill, fillval=fillval, dtype=dtype)
+    if path is not None:
+        write_synth(path, var=var, **kwargs)
+        if path.endswith('.npy'):
+            return np.load(path, mmap_mode='r')
+        return xr.open_dataset(path)
+
+    coords = _get_synth_coords(ntimes=ntimes, nlvls=nlvls, nlats=nlats,
+                               nlons=nlons, start=start, freq=freq)
+    shape = (ntimes, nlvls, nlats, nlons)
+    if lazy:
+        import dask
+        import dask.array as da
+
+        if chunk is None:
+            chunk = max(1, int(8e7 // (np.prod(shape[1:]) *
+                                       np.dtype(dtype).itemsize)))
+        blocks = []
+        for i in range(0, ntimes, chunk):
+            stop = min(i + chunk, ntimes)
+            block = dask.delayed(_get_synth_block)(
+                coords, i, stop, seed=seed, missing=missing, fill=fill,
+                fillval=fillval, dtype=dtype)
+            blocks.append(da.from_delayed(block, (stop - i,) + shape[1:],
+                                          dtype=dtype))
+        data = da.concatenate(blocks, axis=0)
+    else:
+        data = np.empty(shape, dtype=dtype)
+        for slc, block in iter_synth(**kwargs):
+            data[slc] = block
+
+    da_var = xr.DataArray(data, coords=coords,
+                          dims=('time', 'lvl', 'lat', 'lon'),
+                          attrs={'units': 'K', 'missing_value': fillval})
+    return da_var.to_dataset(name=var)
@@ -1,11 +1,26 @@
-from operator import itemgetter
+from scipy.spatial import cKDTree
 from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from functools import partial, wraps
+from contextlib import contextmanager
+import atexit
 import xarray as xr
+import pandas as pd
 import numpy as np
 import glob as g
+import fnmatch
 import linecache
+import tempfile
+import mmap
+import os
+import hashlib
+import importlib
+import inspect
+import json
+import tracemalloc
 import itertools
 import datetime
+import calendar
 import time
 import sys
 import re
@@ -48,6 +63,26 @@ MISC = {'months_initial': ['J', 'F', 'M', 'A', 'M', 'J',
                                 31, 30, 31, 30, 31],
         }
 
+EARTH_RADIUS = 6371000.
+
+GRIDS = {}
+GRIDS_MAXSIZE = 32
+
+POOLS = {}
+
+KDTREES = {}
+
+FILE_INDEX = {}
+DT_DIRECTIVES = {'Y': r'\d{4}', 'y': r'\d{2}', 'm': r'\d{1,2}',
+                 'd': r'\d{1,2}', 'H': r'\d{1,2}', 'M': r'\d{1,2}',
+                 'S': r'\d{1,2}', 'j': r'\d{1,3}', 'f': r'\d{1,6}',
+                 'b': r'[A-Za-z]{3}', 'B': r'[A-Za-z]+', '%': '%'}
+
+PROFILE = {'enabled': False, 'memory': False, 'tracemalloc': False,
+           'stats': {}, 'stack': [], 'wrapped': {}, 'patched': []}
+PROFILE_SKIP = ['profile', 'profiled', 'enable_profiling',
+                'disable_profiling', 'reset_profile', 'get_profile']
+
 
 def ahh(variable=None,
         n='ahh',
@@ -66,6 +101,9 @@ def ahh(variable=None,
         fillval_low=-99999.,
         quiet=False,
         stop=False,
+        lazy=False,
+        chunk=None,
+        sample_size=10000,
         **named_vars):
     """
     Wrapper of one_ahh(); explores a variable.
@@ -90,6 +128,10 @@ def ahh(variable=None,
     :param named_vars: (args) - named variables to be evaluated (fills in n)
     :param quiet: (boolean) - whether to show snippet/center values
     :param stop: (boolean) - whether to stop the ahh-ing in a loop
+    :param lazy: (boolean) - whether to read the variable chunk by chunk
+                             instead of loading it; the median is estimated
+    :param chunk: (int) - if lazy, number of leading indices read at once
+    :param sample_size: (int) - if lazy, number of values kept for the median
     :return stop: (boolean) - stop the ahh-ing in a loop
     """
     kwargs = {'ignore': ignore, 'col': col, 'time': time, 'level': level,
@@ -97,12 +139,13 @@ def ahh(variable=None,
               'precision': precision, 'edgeitems': edgeitems,
               'suppress': suppress, 'snippet': snippet,
               'fillval_high': fillval_high, 'fillval_low': fillval_low,
-              'quiet': quiet, 'stop': stop}
+              'quiet': quiet, 'stop': stop, 'lazy': lazy, 'chunk': chunk,
+              'sample_size': sample_size}
     if stop:
         return True
     else:
         if variable is not None:
-            xr_variables = ahh_xr_check(variable)
+            xr_variables = ahh_xr_check(variable, lazy=lazy)
             if len(xr_variables) == 0:
                 one_ahh(variable=variable, n=n, **kwargs)
             elif len(xr_variables) == 1:
@@ -117,7 +160,7 @@ def ahh(variable=None,
                     one_ahh(variable=xr_variable[1], n=n, **kwargs)
         for name, item in named_vars.items():
             n = name
-            xr_variables = ahh_xr_check(item)
+            xr_variables = ahh_xr_check(item, lazy=lazy)
             if len(xr_variables) == 0:
                 one_ahh(variable=item, n=n, **kwargs)
             elif len(xr_variables) == 1:
@@ -133,45 +176,47 @@ def ahh(variable=None,
         return True
 
 
-def ahhh(*variables, **named_vars):
+def ahhh(*variables, lazy=False, **named_vars):
     """
     The lite version of ahh; pass as many variables to this,
     but no settings to change
 
+    :param lazy: (boolean) - whether to summarize xarray objects chunk by
+                             chunk without loading them (estimated median)
     :param named_vars: (args) - variables to be evaluated
     :return stop: (boolean) - stop the ahh-ing in a loop
     """
     n = 'ahh'
     for item in variables:
-        xr_variables = ahh_xr_check(item)
+        xr_variables = ahh_xr_check(item, lazy=lazy)
         if len(xr_variables) == 0:
             one_ahh(variable=item)
         elif len(xr_variables) == 1:
             variable = xr_variables[0][1]
             if n is 'ahh':
                 n = xr_variables[0][0]
-            one_ahh(variable=variable, n=n)
+            one_ahh(variable=variable, n=n, lazy=lazy)
         elif len(xr_variables) > 1:
             for i, xr_variable in enumerate(xr_variables):
                 if n is 'ahh':
                     n = xr_variable[0]
-                one_ahh(variable=xr_variable[1], n=n)
+                one_ahh(variable=xr_variable[1], n=n, lazy=lazy)
 
     for name, item in named_vars.items():
         n = name
-        xr_variables = ahh_xr_check(item)
+        xr_variables = ahh_xr_check(item, lazy=lazy)
         if len(xr_variables) == 0:
             one_ahh(variable=item, n=n)
         elif len(xr_variables) == 1:
             variable = xr_variables[0][1]
             if n is 'ahh':
                 n = xr_variables[0][0]
-            one_ahh(variable=variable, n=n)
+            one_ahh(variable=variable, n=n, lazy=lazy)
         elif len(xr_variables) > 1:
             for i, xr_variable in enumerate(xr_variables):
                 if n is 'ahh':
                     n = xr_variable[0]
-                one_ahh(variable=xr_variable[1], n=n)
+                one_ahh(variable=xr_variable[1], n=n, lazy=lazy)
 
 
 def one_ahh(variable,
@@ -190,7 +235,10 @@ def one_ahh(variable,
             fillval_high=99999.,
             fillval_low=-99999.,
             quiet=False,
-            stop=False
+            stop=False,
+            lazy=False,
+            chunk=None,
+            sample_size=10000
             ):
     """
     Explores type, unnested type, length, and shape of a variable.
@@ -215,6 +263,10 @@ def one_ahh(variable,
                           not be included in the min
     :param quiet: (boolean) - whether to show snippet/center values
     :param stop: (boolean) - whether to stop the ahh-ing in a loop
+    :param lazy: (boolean) - whether to read the variable chunk by chunk
+                             instead of loading it; the median is estimated
+    :param chunk: (int) - if lazy, number of leading indices read at once
+    :param sample_size: (int) - if lazy, number of values kept for the median
     """
     if stop:
         pass
@@ -233,7 +285,7 @@ def one_ahh(variable,
             col_names = None
             type_of_var = type(variable)
 
-            if ignore is not None:
+            if ignore is not None and not lazy:
                 variable = np.where(variable == ignore,
                                     np.nan, variable).astype('float')
 
@@ -244,10 +296,15 @@ def one_ahh(variable,
                 len_of_var = 0
                 center_of_var = None
             try:
-                shape_of_var = np.ma.array(variable).shape
+                if lazy:
+                    shape_of_var = tuple(np.shape(variable))
+                else:
+                    shape_of_var = np.ma.array(variable).shape
                 len_shape_of_var = len(shape_of_var)
                 try:
-                    if len_shape_of_var == 1:
+                    if lazy:
+                        type_of_var2 = np.dtype(variable.dtype).type
+                    elif len_shape_of_var == 1:
                         type_of_var2 = type(variable[0])
                     elif len_shape_of_var == 2:
                         type_of_var2 = type(variable[0][0])
@@ -273,17 +330,24 @@ def one_ahh(variable,
                 pass
 
             try:
-                nanmask = np.logical_not(np.isnan(variable))
-                variable_ravel = np.ravel(variable[nanmask])
-                fillval_idc = np.where(
-                                      (variable_ravel < fillval_high) &
-                                      (variable_ravel > fillval_low)
-                                      )
-                variable_clean = variable_ravel[fillval_idc]
-                max_of_var = np.nanmax(variable_clean)
-                min_of_var = np.nanmin(variable_clean)
-                avg_of_var = np.nanmean(variable_clean)
-                med_of_var = np.nanmedian(variable_clean)
+                if lazy:
+                    (min_of_var, max_of_var,
+                     avg_of_var, med_of_var) = _get_lazy_stats(
+                        variable, ignore=ignore, fillval_high=fillval_high,
+                        fillval_low=fillval_low, chunk=chunk,
+                        sample_size=sample_size)
+                else:
+                    nanmask = np.logical_not(np.isnan(variable))
+                    variable_ravel = np.ravel(variable[nanmask])
+                    fillval_idc = np.where(
+                                          (variable_ravel < fillval_high) &
+                                          (variable_ravel > fillval_low)
+                                          )
+                    variable_clean = variable_ravel[fillval_idc]
+                    max_of_var = np.nanmax(variable_clean)
+                    min_of_var = np.nanmin(variable_clean)
+                    avg_of_var = np.nanmean(variable_clean)
+                    med_of_var = np.nanmedian(variable_clean)
             except:
                 report_err()
                 print('Unable to get the max/min values!')
@@ -329,19 +393,19 @@ def one_ahh(variable,
                             pass
                     elif len_shape_of_var == 2:
                         try:
-                            print(variable[:, :][0])
+                            print(_get_values(variable[:, :][0]))
                         except:
                             print(variable)
                     elif len_shape_of_var == 3:
                         try:
-                            print(variable[time, :, :][0])
+                            print(_get_values(variable[time, :, :][0]))
                         except:
-                            print(variable[0])
+                            print(_get_values(variable[0]))
                     elif len_shape_of_var == 4:
                         try:
-                            print(variable[time, level, :, :][0])
+                            print(_get_values(variable[time, level, :, :][0]))
                         except:
-                            print(variable[0][0])
+                            print(_get_values(variable[0][0]))
                     else:
                         if len_of_var > 30:
                             print(np.array(variable))
@@ -358,7 +422,7 @@ def one_ahh(variable,
                                           lon=center_lon_of_var + offset
                                           )
                                   )
-                            print(variable[
+                            print(_get_values(variable[
                                            int(center_lat_of_var -
                                                center + offset):
                                            int(center_lat_of_var +
@@ -367,7 +431,7 @@ def one_ahh(variable,
                                                center + offset):
                                            int(center_lon_of_var +
                                                center + offset),
-                                           ][0]
+                                           ][0])
                                   )
                         elif len_shape_of_var == 3:
                             print('Center lat indice {lat}, lon indice {lon}:'
@@ -375,7 +439,7 @@ def one_ahh(variable,
                                           lon=center_lon_of_var + offset
                                           )
                                   )
-                            print(variable[
+                            print(_get_values(variable[
                                            time,
                                            int(center_lat_of_var -
                                                center + offset):
@@ -385,7 +449,7 @@ def one_ahh(variable,
                                                center + offset):
                                            int(center_lon_of_var +
                                                center + offset),
-                                           ][0]
+                                           ][0])
                                   )
                         elif len_shape_of_var == 4:
                             print('Center lat indice {lat}, lon indice {lon}:'
@@ -393,7 +457,7 @@ def one_ahh(variable,
                                           lon=center_lon_of_var + offset
                                           )
                                   )
-                            print(variable[
+                            print(_get_values(variable[
                                            time,
                                            level,
                                            int(center_lat_of_var -
@@ -404,7 +468,7 @@ def one_ahh(variable,
                                                center + offset):
                                            int(center_lon_of_var +
                                                center + offset),
-                                           ][0]
+                                           ][0])
                                   )
                         else:
                             print('Center indice {}:'
@@ -425,20 +489,106 @@ def one_ahh(variable,
             print('')
 
 
-def ahh_xr_check(variable):
+def update_sample(sample, block, nseen, rng):
+    """
+    Updates a fixed-size reservoir sample with a new block of values.
+
+    :param sample: (np.array) - reservoir of previously kept values
+    :param block: (np.array) - 1D block of new values
+    :param nseen: (int) - number of values seen before this block
+    :param rng: (np.random.RandomState) - random number generator
+    :return sample: (np.array) - updated reservoir
+    """
+    size = len(sample)
+    nfill = max(min(size - nseen, len(block)), 0)
+    sample[nseen:nseen + nfill] = block[:nfill]
+    if nfill < len(block):
+        ranks = np.arange(nseen + nfill, nseen + len(block)) + 1
+        slots = (rng.random_sample(len(ranks)) * ranks).astype(np.int64)
+        keep = slots < size
+        sample[slots[keep]] = block[nfill:][keep]
+    return sample
+
+
+def _get_lazy_stats(variable, ignore=None,
+                    fillval_high=99999., fillval_low=-99999.,
+                    chunk=None, sample_size=10000, seed=0):
+    """
+    Reads a variable chunk by chunk along its first axis (without loading
+    it whole) to find min/max/mean in one pass and estimate the median
+    from a reservoir sample (exact if there are no more than sample_size
+    valid values).
+
+    :param variable: (xr.DataArray/netCDF4.Variable/array) - variable
+    :param ignore: (scalar) - a value to ignore
+    :param fillval_high: (float) - ignore values equal/greater than this
+    :param fillval_low: (float) - ignore values equal/less than this
+    :param chunk: (int) - number of leading indices to read at once
+    :param sample_size: (int) - max number of values kept for the median
+    :param seed: (int) - seed of the reservoir sampling
+    :return mini, maxi, avg, med: (float, float, float, float) - stats
+    """
+    shape = np.shape(variable)
+    if len(shape) == 0:
+        variable = np.atleast_1d(variable)
+        shape = variable.shape
+    if chunk is None:
+        chunk = max(1, int(1e6 // max(np.prod(shape[1:]), 1)))
+
+    rng = np.random.RandomState(seed)
+    sample = np.empty(sample_size)
+    count, total, mini, maxi = 0, 0., np.inf, -np.inf
+    for start in range(0, shape[0], chunk):
+        block = variable[start:start + chunk]
+        block = getattr(block, 'values', block)
+        block = np.ma.filled(np.ma.array(block, dtype=float), np.nan).ravel()
+        if ignore is not None:
+            block = block[block != ignore]
+        block = block[(block < fillval_high) & (block > fillval_low)]
+        if block.size == 0:
+            continue
+        mini = min(mini, block.min())
+        maxi = max(maxi, block.max())
+        total += block.sum()
+        sample = update_sample(sample, block, count, rng)
+        count += block.size
+
+    if count == 0:
+        return np.nan, np.nan, np.nan, np.nan
+    med = np.median(sample[:min(count, sample_size)])
+    return mini, maxi, total / count, med
+
+
+def _get_values(variable):
+    """
+    Returns the values of a (lazy) xarray/pandas object, else itself.
+
+    :param variable: (array) - variable to be evaluated
+    :return values: (array) - values of the variable
+    """
+    return getattr(variable, 'values', variable)
+
+
+def ahh_xr_check(variable, lazy=False):
     """
     Checks if variable is xarray; if so, return list of names and items
 
     :param variable: (array) - variable to be evaluated
+    :param lazy: (boolean) - whether to return the DataArrays unloaded
     :return varlist: (list) - list of tuples of variable name and values
     """
     if isinstance(variable, xr.Dataset):
         variable_list = []
         var_names = list(variable.data_vars)
         for var_name in var_names:
-            variable_list.append(variable[var_name].values)
+            if lazy:
+                variable_list.append(variable[var_name])
+            else:
+                variable_list.append(variable[var_name].values)
         return list(zip(var_names, variable_list))
     elif isinstance(variable, xr.DataArray):
+        if lazy:
+            return [(variable.name, variable)]
         return [(variable.name, variable.values)]
     else:
         return []
@@ -488,6 +638,138 @@ def lonw2e(lon, reverse=False):
     return translated_lon
 
 
+def _get_grid_key(*coords):
+    """
+    Hashes coordinate arrays by their dtype, shape, and bytes.
+
+    :param coords: (np.array) - coordinate arrays
+    :return key: (str) - sha1 hex digest
+    """
+    sha1 = hashlib.sha1()
+    for coord in coords:
+        if coord is None:
+            sha1.update(b'None')
+            continue
+        coord = np.ascontiguousarray(coord)
+        sha1.update('{0}{1}'.format(coord.dtype.str, coord.shape).encode())
+        sha1.update(coord.tobytes() if coord.ndim == 0 else coord)
+    return sha1.hexdigest()
+
+
+def _get_edges(coord, lower=None, upper=None):
+    """
+    Finds cell edges halfway between 1D coordinate values.
+
+    :param coord: (np.array) - 1D coordinate values
+    :param lower: (scalar) - lowest allowed edge
+    :param upper: (scalar) - highest allowed edge
+    :return edges: (np.array) - edges with length len(coord) + 1
+    """
+    if len(coord) < 2:
+        return np.array([coord[0], coord[0]], dtype=float)
+    mids = (coord[1:] + coord[:-1]) / 2.
+    edges = np.concatenate([[2 * coord[0] - mids[0]], mids,
+                            [2 * coord[-1] - mids[-1]]])
+    if lower is not None or upper is not None:
+        edges = np.clip(edges, lower, upper)
+    return edges
+
+
+def get_grid(lats, lons=None):
+    """
+    Gets the geometry of a grid, computed once per unique lats/lons and
+    cached in GRIDS: cos(lat) weights, spherical cell areas (m^2) kept as
+    1D lat (area_lat) and lon (area_lon) factors whose outer product is
+    the area of each cell (see get_area), monotonicity and spacing.
+
+    :param lats: (np.array) - 1D array of latitudes
+    :param lons: (np.array) - 1D array of longitudes
+    :return grid: (dict) - geometry of the grid
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = None if lons is None else np.asarray(lons, dtype=float)
+    key = _get_grid_key(lats, lons)
+    if key in GRIDS:
+        return GRIDS[key]
+
+    grid = {'lats': lats, 'lons': lons,
+            'coslat': np.cos(np.radians(lats))}
+    for name, coord in [('lat', lats), ('lon', lons)]:
+        if coord is None or coord.ndim != 1 or len(coord) == 0:
+            continue
+        diffs = np.diff(coord)
+        grid[name + '_ascending'] = bool(np.all(diffs > 0))
+        grid[name + '_descending'] = bool(np.all(diffs < 0))
+        grid[name + '_monotonic'] = (grid[name + '_ascending'] or
+                                     grid[name + '_descending'])
+        grid['d' + name] = np.abs(diffs).mean() if len(diffs) else 0.
+        grid[name + '_regular'] = bool(len(diffs) == 0 or
+                                       np.allclose(diffs, diffs[0]))
+
+    if lons is not None and lats.ndim == 1 and lons.ndim == 1:
+        lat_edges = np.radians(_get_edges(lats, -90, 90))
+        lon_edges = np.radians(_get_edges(lons))
+        grid['area_lat'] = EARTH_RADIUS ** 2 * np.abs(
+            np.diff(np.sin(lat_edges)))
+        grid['area_lon'] = np.abs(np.diff(lon_edges))
+
+    if len(GRIDS) >= GRIDS_MAXSIZE:
+        GRIDS.pop(next(iter(GRIDS)))
+    GRIDS[key] = grid
+    return grid
+
+
+def get_area(lats, lons):
+    """
+    Gets the spherical area of each grid cell; built on demand from the
+    cached 1D factors of get_grid so only the small factors are kept.
+
+    :param lats: (np.array) - 1D array of latitudes
+    :param lons: (np.array) - 1D array of longitudes
+    :return area: (np.array) - (lat, lon) cell areas in m^2
+    """
+    grid = get_grid(lats, lons)
+    return np.outer(grid['area_lat'], grid['area_lon'])
+
+
+def _get_coord_slice(coord, lower, upper):
+    """
+    Finds the slice of a coordinate between lower and upper (inclusive),
+    by binary search if the coordinate is monotonic.
+
+    :param coord: (np.array) - 1D coordinate values
+    :param lower: (float) - lower boundary
+    :param upper: (float) - upper boundary
+    :return slc: (slice/np.array) - slice of the coordinate, or indices
+                                    if the coordinate isn't monotonic
+    """
+    if coord.ndim == 1 and len(coord) > 1:
+        if (coord[1:] > coord[:-1]).all():
+            return slice(int(np.searchsorted(coord, lower, side='left')),
+                         int(np.searchsorted(coord, upper, side='right')))
+        elif (coord[1:] < coord[:-1]).all():
+            reverse = coord[::-1]
+            start = int(np.searchsorted(reverse, lower, side='left'))
+            end = int(np.searchsorted(reverse, upper, side='right'))
+            return slice(len(coord) - end, len(coord) - start)
+
+    return np.where((coord >= lower) & (coord <= upper))[0]
+
+
+def _slice2idc(slc):
+    """
+    Converts a slice, or a tuple of slices, into an array of indices.
+
+    :param slc: (slice/tuple) - slice(s) of a coordinate
+    :return idc: (np.array) - sorted indices
+    """
+    if isinstance(slc, slice):
+        return np.arange(slc.start, slc.stop)
+    elif isinstance(slc, np.ndarray):
+        return slc
+    return np.sort(np.concatenate([_slice2idc(one) for one in slc]))
+
+
 def get_idc(lats,
             lons,
             lower_lat,
@@ -496,9 +778,12 @@ def get_idc(lats,
             right_lon,
             maxmin=False,
             w2e=False,
-            e2w=False):
+            e2w=False,
+            as_slice=False,
+            wrap=False):
     """
     Finds the indices for given latitudes and longitudes boundary.
+    Monotonic coordinates are searched by bisection.
 
     :param lats: (np.array) - array of latitudes
     :param lons: (np.array) - array of longitudes
@@ -509,13 +794,23 @@ def get_idc(lats,
     :param maxmin: (boolean) - return only the max and min of lat/lon idc
     :param w2e: (boolean) - convert input west longitudes to east longitudes
     :param e2w: (boolean) - convert input east longitudes to west longitudes
-    :return lats_idc, lons_idc: (np.array, np.array) - indices of lats/lons
+    :param as_slice: (boolean) - return slices instead of indices
+    :param wrap: (boolean) - if right_lon < left_lon, treat the box as
+                             crossing the dateline instead of swapping
+    :return lats_idc, lons_idc: (np.array, np.array/tuple) - indices of
+                                lats/lons; a box crossing the dateline
+                                gives a tuple of the west and east lon
+                                indices
+    :return lat_slice, lon_slice: (slice, slice/tuple) - if as_slice;
+                                  a box crossing the dateline gives a
+                                  tuple of the west and east lon slices
+                                  (indices if a coordinate isn't monotonic)
     :return lat_start_idc, lat_end_idc, lon_start_idc, lon_end_idc: \
              (np.int64, np.int64, np.int64, np.int64) \
              the lowest and highest lat/lon indices
     """
-    lats = np.array(lats)
-    lons = np.array(lons)
+    lats = np.asarray(lats)
+    lons = np.asarray(lons)
 
     if w2e:
         left_lon = lonw2e(left_lon)
@@ -525,25 +820,23 @@ def get_idc(lats,
         left_lon = lonw2e(left_lon, reverse=True)
         right_lon = lonw2e(right_lon, reverse=True)
 
-    lats_idc = np.where(
-                         (lats >= lower_lat)
-                         &
-                         (lats <= upper_lat)
-                         )
+    lat_slice = _get_coord_slice(lats, lower_lat, upper_lat)
+    if right_lon < left_lon and wrap:
+        lon_slice = (_get_coord_slice(lons, left_lon, np.inf),
+                     _get_coord_slice(lons, -np.inf, right_lon))
+    elif right_lon < left_lon:
+        print('Input right_lon < left_lon! '
+              'Their positions are auto swapped!')
+        lon_slice = _get_coord_slice(lons, right_lon, left_lon)
+    else:
+        lon_slice = _get_coord_slice(lons, left_lon, right_lon)
 
-    if right_lon < left_lon:
-        lons_idc = np.where(
-                             (lons >= right_lon)
-                             &
-                             (lons <= left_lon)
-                             )
+    lats_idc = _slice2idc(lat_slice)
+    lons_idc = _slice2idc(lon_slice)
+    if isinstance(lon_slice, tuple):
+        lon_parts = tuple(_slice2idc(part) for part in lon_slice)
     else:
-        lons_idc = np.where(
-                             (lons >= left_lon)
-                             &
-                             (lons <= right_lon)
-                             )
-        print('Input right_lon < left_lon! Their positions are auto swapped!')
+        lon_parts = lons_idc
 
     if len(lats_idc) == 0:
         print('Unable to find any lat indices within the range!')
@@ -552,15 +845,16 @@ def get_idc(lats,
         print('Perhaps convert west longitudes to east, or vice versa?')
 
     if maxmin:
-        lats_idc = lats_idc[0].min(), lats_idc[0].max()
-        lons_idc = lons_idc[0].min(), lons_idc[0].max()
-        lat_start_idc = lats_idc[0]
-        lat_end_idc = lats_idc[1]
-        lon_start_idc = lons_idc[0]
-        lon_end_idc = lons_idc[1]
+        lat_start_idc = lats_idc.min()
+        lat_end_idc = lats_idc.max()
+        lon_start_idc = lons_idc.min()
+        lon_end_idc = lons_idc.max()
         return lat_start_idc, lat_end_idc, lon_start_idc, lon_end_idc
 
-    return lats_idc[0], lons_idc[0]
+    if as_slice:
+        return lat_slice, lon_slice
+
+    return lats_idc, lon_parts
 
 
 def get_lvls_idc(lvls, lower_lvl, upper_lvl, maxmin=False):
@@ -615,16 +909,8 @@ def get_times_idc(times, start_yr, end_yr,
             the lowest and highest time indices
     """
     start_dt = datetime.datetime(start_yr, start_mth, start_day)
-    while True:
-        try:
-            end_dt = datetime.datetime(end_yr, end_mth, end_day)
-            break
-        except Exception as e:
-            end_day -= 1
-            print('Unable to create end datetime due to this error\n{}'
-                  .format(e))
-            print('Changing end day to {}!'
-                  .format(end_day))
+    end_day = min(end_day, calendar.monthrange(end_yr, end_mth)[1])
+    end_dt = datetime.datetime(end_yr, end_mth, end_day)
 
     times_idc = np.where(
                          (times >= start_dt)
@@ -632,7 +918,7 @@ def get_times_idc(times, start_yr, end_yr,
                          (times <= end_dt)
                          )
 
-    if len(times_idc) == 0:
+    if len(times_idc[0]) == 0:
         print('Unable to find any times indices within the range!')
 
     if maxmin:
@@ -644,27 +930,186 @@ def get_times_idc(times, start_yr, end_yr,
     return times_idc[0]
 
 
+def get_seas_bounds(start_yr, end_yr, start_mth=12, end_mth=2,
+                    start_day=1, end_day=31):
+    """
+    Gets the start and end datetimes of a recurring window for every year;
+    if end_mth < start_mth, a window starts the year before it ends
+    (e.g. DJF 1951 runs from Dec 1, 1950 to Feb 28, 1951).
+
+    :param start_yr: (int) - year the first window ends in
+    :param end_yr: (int) - year the last window ends in
+    :param start_mth: (int) - month each window starts
+    :param end_mth: (int) - month each window ends
+    :param start_day: (int) - day each window starts
+    :param end_day: (int) - day each window ends; clipped to month length
+    :return starts, ends: (pd.DatetimeIndex, pd.DatetimeIndex) - bounds
+    """
+    years = np.arange(start_yr, end_yr + 1)
+    start_yrs = years - int(end_mth < start_mth)
+    starts = pd.to_datetime({'year': start_yrs,
+                             'month': np.full(len(years), start_mth),
+                             'day': np.full(len(years), start_day)})
+    end_mths = pd.to_datetime({'year': years,
+                               'month': np.full(len(years), end_mth),
+                               'day': np.ones(len(years), dtype=int)})
+    end_days = np.minimum(end_day, end_mths.dt.days_in_month.values)
+    ends = end_mths + pd.to_timedelta(end_days - 1, unit='D')
+    return pd.DatetimeIndex(starts), pd.DatetimeIndex(ends)
+
+
+def get_times_slices(times, starts, ends):
+    """
+    Finds the slices of sorted times within many windows at once
+    by binary search (inclusive of both bounds).
+
+    :param times: (np.array) - sorted array of datetimes
+    :param starts: (np.array) - start datetime of each window
+    :param ends: (np.array) - end datetime of each window
+    :return slices: (list) - slice of times for each window
+    """
+    times = pd.DatetimeIndex(times).values
+    starts = pd.DatetimeIndex(np.atleast_1d(starts)).values
+    ends = pd.DatetimeIndex(np.atleast_1d(ends)).values
+    start_idc = np.searchsorted(times, starts, side='left')
+    end_idc = np.searchsorted(times, ends, side='right')
+    return [slice(int(start), int(end))
+            for start, end in zip(start_idc, end_idc)]
+
+
+def get_times_windows(data, slices, axis=0):
+    """
+    Gathers windows of data into one stacked array with a single take;
+    windows shorter than the longest are masked at their ends.
+
+    :param data: (np.array) - data with times along axis
+    :param slices: (list) - slices from get_times_slices()
+    :param axis: (int) - axis of times
+    :return windows: (np.ma.array) - (window, time in window, ...) array
+    """
+    data = np.asanyarray(data)
+    axis = axis % data.ndim
+    start_idc = np.array([slc.start for slc in slices], dtype=int)
+    end_idc = np.array([slc.stop for slc in slices], dtype=int)
+    max_len = int((end_idc - start_idc).max()) if len(slices) else 0
+
+    idc = start_idc[:, None] + np.arange(max_len)[None, :]
+    valid = idc < end_idc[:, None]
+    idc = np.where(valid, idc, np.maximum(end_idc - 1, 0)[:, None])
+
+    windows = np.moveaxis(np.take(data, idc, axis=axis), [axis, axis + 1],
+                          [0, 1])
+    mask = np.broadcast_to(
+        ~valid.reshape(valid.shape + (1,) * (windows.ndim - 2)),
+        windows.shape)
+    return np.ma.array(windows, mask=mask)
+
+
+def _get_closest_idc(data, targets):
+    """
+    Finds the index of the closest value in data for each target by
+    binary search (data is argsorted first if not ascending).
+
+    :param data: (np.array) - 1D numeric data
+    :param targets: (np.array) - target values
+    :return idc: (np.array) - indices of the closest values
+    """
+    order = None
+    if len(data) > 1 and not np.all(data[1:] >= data[:-1]):
+        order = np.argsort(data, kind='mergesort')
+        data = data[order]
+
+    right = np.clip(np.searchsorted(data, targets), 1, len(data) - 1)
+    left = right - 1
+    if len(data) == 1:
+        right = left = np.zeros_like(right)
+    use_right = np.abs(data[right] - targets) < np.abs(targets - data[left])
+    idc = np.where(use_right, right, left)
+
+    if order is not None:
+        idc = order[idc]
+    return idc
+
+
 def get_closest(data, target_val, type_var='typical'):
     """
-    Get the closest value and index to target value.
+    Get the closest value and index to target value(s); an array of
+    targets is matched all at once by binary search.
 
     :param data: (np.array) - data
-    :param target_val: (float/datetime.datetime) - target value
+    :param target_val: (float/datetime.datetime/arr) - target value(s)
     :param type_var: (str) - typical (float) or datetime (datetime.datetime)
     :return closest_val, closest_val_idc: (datetime.datetime/float, int) -
              the closest value to target value and the index of that
+             (arrays of them if target_val is an array)
     """
-    if type_var == 'typical':
-        diff = np.abs(np.array(data) - target_val)
-        closest_val_idc = min(enumerate(diff), key=itemgetter(1))[0]
-        return data[closest_val_idc], closest_val_idc
     if type_var == 'datetime':
-        closest_val = min(data, key=lambda d: abs(d - target_val))
-        closest_val_idc = np.where(data == closest_val)[0]
-        if len(closest_val_idc) == 0:
-            data = np.ma.array(data)
-            closest_val_idc = np.where(data == closest_val)[0]
+        values = pd.DatetimeIndex(data).values.astype(np.int64)
+        targets = pd.DatetimeIndex(np.atleast_1d(target_val))
+        targets = targets.values.astype(np.int64)
+    else:
+        values = np.asarray(data)
+        targets = np.atleast_1d(target_val)
+
+    if np.ndim(target_val) == 0 and type_var == 'typical':
+        closest_val_idc = int(np.argmin(np.abs(values - target_val)))
+        return data[closest_val_idc], closest_val_idc
+
+    closest_val_idc = _get_closest_idc(values, targets)
+    if np.ndim(target_val) == 0:
+        closest_val = data[closest_val_idc[0]]
+        closest_val_idc = np.where(values == values[closest_val_idc[0]])[0]
         return closest_val, closest_val_idc
+    return np.asarray(data)[closest_val_idc], closest_val_idc
+
+
+def _latlon2xyz(lats, lons):
+    """
+    Converts latitudes and longitudes into 3D unit vectors.
+
+    :param lats: (np.array) - latitudes
+    :param lons: (np.array) - longitudes
+    :return xyz: (np.array) - (n, 3) unit vectors
+    """
+    lats = np.radians(np.ravel(lats))
+    lons = np.radians(np.ravel(lons))
+    return np.column_stack([np.cos(lats) * np.cos(lons),
+                            np.cos(lats) * np.sin(lons),
+                            np.sin(lats)])
+
+
+def get_closest_latlon(lats, lons, target_lats, target_lons):
+    """
+    Get the closest grid points to target locations by great-circle
+    distance, all at once, using a KD-tree of 3D unit vectors that is
+    cached per lats/lons in KDTREES.
+
+    :param lats: (np.array) - 1D latitudes of a grid or 2D latitudes
+    :param lons: (np.array) - 1D longitudes of a grid or 2D longitudes
+    :param target_lats: (scalar/np.array) - latitudes of targets
+    :param target_lons: (scalar/np.array) - longitudes of targets
+    :return (lat_idc, lon_idc), dists: ((np.array, np.array), np.array) -
+             grid indices (row, col if 2D) and distances in meters
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    key = _get_grid_key(lats, lons)
+    if key in KDTREES:
+        tree, shape = KDTREES[key]
+    else:
+        if lats.ndim == 1:
+            lons_mesh, lats_mesh = np.meshgrid(lons, lats)
+        else:
+            lons_mesh, lats_mesh = lons, lats
+        tree = cKDTree(_latlon2xyz(lats_mesh, lons_mesh))
+        shape = lats_mesh.shape
+        if len(KDTREES) >= GRIDS_MAXSIZE:
+            KDTREES.pop(next(iter(KDTREES)))
+        KDTREES[key] = tree, shape
+
+    chords, idc = tree.query(_latlon2xyz(target_lats, target_lons))
+    dists = 2 * EARTH_RADIUS * np.arcsin(np.clip(chords / 2., 0, 1))
+    return np.unravel_index(idc, shape), dists
 
 
 def flatten(nested_list):
@@ -748,6 +1193,89 @@ def split_consec(data):
     return np.split(data, np.where(np.diff(data) != 0)[0] + 1)
 
 
+def get_runs(data):
+    """
+    Run-length encodes a 1D array; consecutive NaNs count as one run.
+    For example, x = [1, 1, 3, 2]
+    get_runs(x) == (array([1, 3, 2]), array([0, 2, 3]), array([2, 1, 1]))
+
+    :param data: (arr) - 1D array of data
+    :return values, starts, lengths: (arr, arr, arr) - value, start index
+                                                      and length of runs
+    """
+    data = np.asarray(data).ravel()
+    if data.size == 0:
+        empty = np.array([], dtype=np.intp)
+        return data[:0], empty, empty
+
+    changed = data[1:] != data[:-1]
+    if data.dtype.kind in 'fc':
+        changed &= ~(np.isnan(data[1:]) & np.isnan(data[:-1]))
+    starts = np.concatenate([[0], np.flatnonzero(changed) + 1])
+    lengths = np.diff(np.append(starts, data.size))
+    return data[starts], starts, lengths
+
+
+def get_spells(cond, axis=0, min_length=1):
+    """
+    Finds the spells (runs where a condition holds, i.e. data > 35 for
+    heat waves or precip < 1 for dry spells) along an axis for every
+    other index (i.e. grid cell) at once.
+
+    :param cond: (arr) - boolean array; NaNs count as False
+    :param axis: (int) - axis to look for spells along (i.e. time)
+    :param min_length: (int) - shortest run counted as a spell
+    :return spells: (dict) - arrays shaped like cond without axis:
+                             nspells (count), longest (length of
+                             longest), longest_start (first index of the
+                             earliest longest), total (count of indices in
+                             spells) and mean (length, NaN if no spells)
+    """
+    cond = np.asarray(cond)
+    if cond.dtype != bool:
+        cond = np.nan_to_num(cond) != 0
+    cond = np.moveaxis(cond, axis, -1)
+    out_shape = cond.shape[:-1]
+    cond = cond.reshape(-1, cond.shape[-1])
+    ncells = cond.shape[0]
+
+    padded = np.zeros((ncells, cond.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = cond
+    edges = np.diff(padded, axis=1)
+    flat_starts = np.flatnonzero(edges == 1)
+    lengths = np.flatnonzero(edges == -1) - flat_starts
+    cells, starts = np.divmod(flat_starts, edges.shape[1])
+
+    if min_length > 1:
+        keep = lengths >= min_length
+        cells, starts, lengths = cells[keep], starts[keep], lengths[keep]
+
+    nspells = np.bincount(cells, minlength=ncells)
+    total = np.bincount(cells, weights=lengths, minlength=ncells)
+    longest = np.zeros(ncells, dtype=np.intp)
+    longest_start = np.full(ncells, -1, dtype=np.intp)
+    if len(cells) > 0:
+        # spells are ordered by cell then start, so each cell is a group
+        firsts = np.flatnonzero(np.append(True, cells[1:] != cells[:-1]))
+        group_max = np.maximum.reduceat(lengths, firsts)
+        longest[cells[firsts]] = group_max
+        is_max = lengths == np.repeat(group_max, np.diff(
+            np.append(firsts, len(cells))))
+        max_cells = cells[is_max]
+        earliest = np.append(True, max_cells[1:] != max_cells[:-1])
+        longest_start[max_cells[earliest]] = starts[is_max][earliest]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / nspells
+
+    spells = {'nspells': nspells, 'longest': longest,
+              'longest_start': longest_start,
+              'total': total.astype(np.intp), 'mean': mean}
+    for key in spells:
+        spells[key] = spells[key].reshape(out_shape)
+    return spells
+
+
 def sleep(seconds):
     """
     Wrapper of time.sleep; awaits number of seconds input.
@@ -757,16 +1285,141 @@ def sleep(seconds):
     time.sleep(seconds)
 
 
-def glob(glob_str, nfiles=None, mismatch='warn'):
+def _scan_dir(path):
+    """
+    Lists a single directory with os.scandir.
+
+    :param path: (str) - directory to list
+    :return path, mtime, files, subdirs: (str, int, list, list) - listing
+    """
+    files = []
+    subdirs = []
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        for entry in os.scandir(path):
+            try:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+            except OSError:
+                files.append(entry.name)
+    except OSError:
+        mtime = None
+    return path, mtime, sorted(files), sorted(subdirs)
+
+
+def _get_dir_index(root='.', depth=None, nthreads=1, refresh=False):
+    """
+    Scans a directory tree level by level, reusing the cached listing of
+    every directory whose mtime has not changed since the last scan.
+
+    :param root: (str) - top directory
+    :param depth: (int) - number of levels to scan; None for all
+    :param nthreads: (int) - number of threads to scan subdirectories
+    :param refresh: (boolean) - whether to ignore the cached listings
+    :return dirs: (dict) - relative dir: (mtime, files, subdirs)
+    """
+    key = (os.path.abspath(root), depth)
+    cached = {} if refresh else FILE_INDEX.get(key, {})
+
+    dirs = {}
+    level = ['']
+    nlevel = 1
+    while level:
+        stale = []
+        for rel_dir in level:
+            path = os.path.join(root, rel_dir)
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if rel_dir in cached and cached[rel_dir][0] == mtime:
+                dirs[rel_dir] = cached[rel_dir]
+            else:
+                stale.append(path)
+
+        scans = imap(_scan_dir, stale, nthreads=min(nthreads, len(stale)),
+                     mode='thread')
+        for path, mtime, files, subdirs in scans:
+            if mtime is not None:
+                rel_dir = os.path.relpath(path, root)
+                rel_dir = '' if rel_dir == '.' else rel_dir
+                dirs[rel_dir] = (mtime, files, subdirs)
+
+        if depth is not None and nlevel >= depth:
+            break
+        level = [os.path.join(rel_dir, subdir)
+                 for rel_dir in level if rel_dir in dirs
+                 for subdir in dirs[rel_dir][2]]
+        nlevel += 1
+
+    FILE_INDEX[key] = dirs
+    return dirs
+
+
+def _glob_index(glob_str, nthreads=1, refresh=False):
+    """
+    Matches a glob_str against the cached directory index; same semantics
+    as glob.glob (wildcards do not cross separators, hidden names need
+    an explicit leading dot).
+
+    :param glob_str: (str) - filename wildcard
+    :param nthreads: (int) - number of threads to scan subdirectories
+    :param refresh: (boolean) - whether to ignore the cached listings
+    :return glob_list: (list) - sorted list of filenames
+    """
+    parts = glob_str.split(os.sep)
+    magic = [i for i, part in enumerate(parts) if g.has_magic(part)]
+    if not magic:
+        return [glob_str] if os.path.lexists(glob_str) else []
+
+    root = os.sep.join(parts[:magic[0]])
+    if glob_str.startswith(os.sep) and magic[0] == 1:
+        root = os.sep
+    patterns = parts[magic[0]:]
+    depth = len(patterns)
+    dirs = _get_dir_index(root or os.curdir, depth=depth,
+                          nthreads=nthreads, refresh=refresh)
+
+    level = ['']
+    for i, pattern in enumerate(patterns):
+        last = i == depth - 1
+        match = re.compile(fnmatch.translate(pattern)).match
+        hidden = pattern.startswith('.')
+        matched = []
+        for rel_dir in level:
+            if rel_dir not in dirs:
+                continue
+            _, files, subdirs = dirs[rel_dir]
+            names = files + subdirs if last else subdirs
+            matched.extend(os.path.join(rel_dir, name) for name in names
+                           if match(name) and
+                           (hidden or not name.startswith('.')))
+        level = matched
+
+    glob_list = [os.path.join(root, rel_path) for rel_path in level]
+    return sorted(glob_list)
+
+
+def glob(glob_str, nfiles=None, mismatch='warn', index=False, nthreads=1,
+         refresh=False):
     """
     Return sorted glob list.
 
     :param glob_str: (str) - filename wildcard
     :param nfiles: (int) - number of expected files
     :param mismatch: (str) - warn or raise error
+    :param index: (boolean) - whether to match against a cached os.scandir
+                              index, rescanning only modified directories
+    :param nthreads: (int) - if index, threads to scan subdirectories
+    :param refresh: (boolean) - if index, whether to rescan everything
     :return glob_list: (list) - sorted list of filenames
     """
-    glob_list = sorted(g.glob(glob_str))
+    if index:
+        glob_list = _glob_index(glob_str, nthreads=nthreads, refresh=refresh)
+    else:
+        glob_list = sorted(g.glob(glob_str))
     glob_len = len(glob_list)
     if glob_len == 0:
         raise EmptyGlob('No files match {0}!'.format(glob_str))
@@ -788,7 +1441,178 @@ def glob(glob_str, nfiles=None, mismatch='warn'):
     return glob_list
 
 
-def parallelize(function, alist, nthreads=2, arg2=None, arg3=None, arg4=None):
+def _fmt2patterns(fmt):
+    """
+    Converts a pre.gen_fi_list fmt (i.e. 'gfs_{dt:%Y%m%d_%H}.nc') into a
+    glob_str, a regex capturing the date and the date's strptime format.
+
+    :param fmt: (str) - string format of files in {dt:%Y%m%d_%H%M} fmt
+    :return glob_str, regex, dt_fmt: (str, re.Pattern, str) - patterns
+    """
+    fields = list(re.finditer(r'\{dt(?::([^}]*))?\}', fmt))
+    if not fields:
+        raise ValueError('No {{dt:...}} field in {0}!'.format(fmt))
+    specs = [field.group(1) or '%Y-%m-%d %H:%M:%S' for field in fields]
+    ndirectives = [spec.count('%') for spec in specs]
+    date_field = len(specs) - 1 - ndirectives[::-1].index(max(ndirectives))
+
+    glob_str = ''
+    regex = ''
+    position = 0
+    for i, (field, spec) in enumerate(zip(fields, specs)):
+        literal = fmt[position:field.start()]
+        glob_str += literal
+        regex += re.escape(literal)
+        pieces = re.split(r'(%.)', spec)
+        spec_glob = ''
+        spec_regex = ''
+        for piece in pieces:
+            if piece.startswith('%') and len(piece) == 2:
+                if piece[1] not in DT_DIRECTIVES:
+                    raise ValueError('Unsupported directive {0}!'
+                                     .format(piece))
+                spec_glob += '%' if piece == '%%' else '*'
+                spec_regex += DT_DIRECTIVES[piece[1]]
+            else:
+                spec_glob += piece
+                spec_regex += re.escape(piece)
+        glob_str += spec_glob
+        if i == date_field:
+            regex += '(' + spec_regex + ')'
+        else:
+            regex += spec_regex
+        position = field.end()
+    glob_str += fmt[position:]
+    regex += re.escape(fmt[position:])
+    return glob_str, re.compile(regex + '$'), specs[date_field]
+
+
+def get_fi_index(fmt, nthreads=1, refresh=False):
+    """
+    Indexes the files matching a pre.gen_fi_list fmt by their date; the
+    directory listing is cached so repeated calls only rescan directories
+    that were modified.
+
+    :param fmt: (str) - string format of files in {dt:%Y%m%d_%H%M} fmt
+    :param nthreads: (int) - number of threads to scan subdirectories
+    :param refresh: (boolean) - whether to rescan everything
+    :return fi_index: (pd.Series) - file names indexed by sorted dates;
+                                    names that aren't valid dates are left
+                                    out
+    """
+    glob_str, regex, dt_fmt = _fmt2patterns(fmt)
+    fi_list = _glob_index(glob_str, nthreads=nthreads, refresh=refresh)
+
+    key = ('fmt', fmt)
+    if key in FILE_INDEX and FILE_INDEX[key][0] == fi_list:
+        return FILE_INDEX[key][1]
+
+    fi_names = []
+    dt_strs = []
+    for fi_name in fi_list:
+        match = regex.match(fi_name)
+        if match is not None:
+            fi_names.append(fi_name)
+            dt_strs.append(match.group(1))
+    dts = pd.to_datetime(pd.Index(dt_strs, dtype=object), format=dt_fmt,
+                         errors='coerce')
+    fi_index = pd.Series(fi_names, index=dts, dtype=object)
+    fi_index = fi_index[fi_index.index.notna()].sort_index()
+    FILE_INDEX[key] = (fi_list, fi_index)
+    return fi_index
+
+
+def get_fi_range(fmt, start=None, end=None, nthreads=1, refresh=False):
+    """
+    Gets the files matching a pre.gen_fi_list fmt that fall within a time
+    range (inclusive) without re-globbing.
+
+    :param fmt: (str) - string format of files in {dt:%Y%m%d_%H%M} fmt
+    :param start: (str/datetime) - start time; None for the first file
+    :param end: (str/datetime) - end time; None for the last file
+    :param nthreads: (int) - number of threads to scan subdirectories
+    :param refresh: (boolean) - whether to rescan everything
+    :return fi_list: (list) - list of file names sorted by date
+    """
+    fi_index = get_fi_index(fmt, nthreads=nthreads, refresh=refresh)
+    start = None if start is None else pd.Timestamp(start)
+    end = None if end is None else pd.Timestamp(end)
+    return fi_index.loc[start:end].tolist()
+
+
+def get_pool(nthreads=2, mode='process', persist=False):
+    """
+    Gets a pool of workers; persistent pools stay warm in POOLS and are
+    reused by later calls with the same mode and nthreads.
+
+    :param nthreads: (int) - number of workers
+    :param mode: (str) - process or thread
+    :param persist: (boolean) - whether to keep the pool for reuse
+    :return pool: (multiprocessing.Pool) - pool of workers
+    """
+    if mode not in ['process', 'thread']:
+        raise ValueError('mode must be thread or process!')
+    key = (mode, nthreads)
+    if persist and key in POOLS:
+        return POOLS[key]
+    pool = Pool(nthreads) if mode == 'process' else ThreadPool(nthreads)
+    if persist:
+        POOLS[key] = pool
+    return pool
+
+
+@atexit.register
+def close_pools():
+    """
+    Closes all persistent pools in POOLS.
+    """
+    while POOLS:
+        pool = POOLS.popitem()[1]
+        pool.close()
+        pool.join()
+
+
+def imap(function, alist, nthreads=2, mode='process', ordered=True,
+         chunksize=1, persist=False, **kwargs):
+    """
+    Lazily maps a function over a list of items, yielding each result
+    as soon as it's ready (in completion order unless ordered).
+
+    :param function: (function) - tasks to apply to list
+    :param alist: (list) - a list of items to parallelize
+    :param nthreads: (int) - number of workers to use
+    :param mode: (str) - serial, thread (I/O bound) or process (CPU bound)
+    :param ordered: (boolean) - whether to yield in the order of alist
+    :param chunksize: (int) - number of items sent to a worker at once
+    :param persist: (boolean) - whether to reuse a warm pool from POOLS
+    :param kwargs: (kwargs) - constant keyword arguments to function
+    :return result: (generator) - results of function
+    """
+    if kwargs:
+        function = partial(function, **kwargs)
+
+    if mode == 'serial' or nthreads <= 1:
+        for item in alist:
+            yield function(item)
+        return
+
+    pool = get_pool(nthreads=nthreads, mode=mode, persist=persist)
+    try:
+        if ordered:
+            results = pool.imap(function, alist, chunksize=chunksize)
+        else:
+            results = pool.imap_unordered(function, alist,
+                                          chunksize=chunksize)
+        for result in results:
+            yield result
+    finally:
+        if not persist:
+            pool.close()
+            pool.join()
+
+
+def parallelize(function, alist, nthreads=2, arg2=None, arg3=None, arg4=None,
+                mode='process', chunksize=None, persist=False, **kwargs):
     """
     Parallelize a function over a list of items.
 
@@ -798,7 +1622,18 @@ def parallelize(function, alist, nthreads=2, arg2=None, arg3=None, arg4=None):
     :param arg2: (any) - constant; repeated argument
     :param arg3: (any) - constant; repeated argument
     :param arg4: (any) - constant; repeated argument
+    :param mode: (str) - serial, thread (I/O bound) or process (CPU bound)
+    :param chunksize: (int) - number of items sent to a worker at once;
+                              if None, chosen like Pool.map does
+    :param persist: (boolean) - whether to reuse a warm pool from POOLS
+    :param kwargs: (kwargs) - constant keyword arguments to function
+    :return output: (list) - results of function in order of alist
     """
+    if chunksize is None:
+        if not hasattr(alist, '__len__'):
+            alist = list(alist)
+        chunksize = max(1, int(np.ceil(len(alist) / (4. * nthreads))))
+
     if arg4 is not None:
         args = zip(alist, itertools.repeat(arg2), itertools.repeat(arg3),
                    itertools.repeat(arg4))
@@ -809,12 +1644,132 @@ def parallelize(function, alist, nthreads=2, arg2=None, arg3=None, arg4=None):
     else:
         args = alist
 
-    pool = Pool(nthreads)
-    output = pool.map(function, args)
-    pool.close()
-    pool.join()
+    return list(imap(function, args, nthreads=nthreads, mode=mode,
+                     chunksize=chunksize, persist=persist, **kwargs))
 
-    return output
+
+def _get_memmap_spec(data=None, shape=None, dtype=None):
+    """
+    Describes a memory-mapped file holding an array; an existing
+    np.memmap is reused as is, otherwise a temporary file (in /dev/shm
+    when available, so it lives in RAM) is created.
+
+    :param data: (np.array) - array to place in the file
+    :param shape: (tuple) - shape of an empty array if data is None
+    :param dtype: (np.dtype) - dtype of an empty array if data is None
+    :return spec: (tuple) - filename, dtype, shape, offset, and whether temp
+    """
+    if isinstance(data, np.memmap) and data.filename is not None and \
+            data.flags.c_contiguous and isinstance(data.base, mmap.mmap):
+        return data.filename, data.dtype.str, data.shape, data.offset, False
+
+    if data is not None:
+        shape, dtype = data.shape, data.dtype
+    shm_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    fd, filename = tempfile.mkstemp(suffix='.dat', dir=shm_dir)
+    os.close(fd)
+    mm = np.memmap(filename, dtype=dtype, mode='w+', shape=shape)
+    if data is not None:
+        mm[:] = data
+    mm.flush()
+    del mm
+    return filename, np.dtype(dtype).str, tuple(shape), 0, True
+
+
+def _open_memmap(spec, mode='r'):
+    """
+    Opens a memory-mapped array described by _get_memmap_spec().
+
+    :param spec: (tuple) - filename, dtype, shape, offset, and whether temp
+    :param mode: (str) - r or r+
+    :return mm: (np.memmap) - memory-mapped array
+    """
+    filename, dtype, shape, offset = spec[:4]
+    return np.memmap(filename, dtype=dtype, mode=mode,
+                     shape=shape, offset=offset)
+
+
+def _map_block(args):
+    """
+    Applies a function to one block of a memory-mapped array and writes
+    the result into the memory-mapped output; used by map_blocks.
+
+    :param args: (tuple) - function, input spec, output spec,
+                           input slices, output slices, and kwargs
+    :return done: (boolean) - True once written
+    """
+    function, in_spec, out_spec, in_slc, out_slc, kwargs = args
+    data = _open_memmap(in_spec, mode='r')
+    out = _open_memmap(out_spec, mode='r+')
+    out[out_slc] = function(data[in_slc], **kwargs)
+    out.flush()
+    return True
+
+
+def map_blocks(function, data, axis=0, nthreads=2, nblocks=None,
+               out_shape=None, out_dtype=None, out_axis=None,
+               mode='process', **kwargs):
+    """
+    Applies a function to blocks of an array split along axis in
+    parallel. In process mode, the input is placed once in a shared
+    memory-mapped file (or reused if already an np.memmap) so each
+    worker reads a zero-copy view of its block instead of a pickled copy,
+    and results are written into a shared output array.
+
+    :param function: (function) - takes a block and returns its result
+    :param data: (np.array) - array to split into blocks
+    :param axis: (int) - axis to split data along
+    :param nthreads: (int) - number of workers to use
+    :param nblocks: (int) - number of blocks; 4 per worker if None
+    :param out_shape: (tuple) - shape of the output; data's if None
+    :param out_dtype: (np.dtype) - dtype of the output; data's if None
+    :param out_axis: (int) - output axis matching the blocks; axis if None
+    :param mode: (str) - serial, thread or process
+    :param kwargs: (kwargs) - constant keyword arguments to function
+    :return out: (np.array) - combined results
+    """
+    data = np.asanyarray(data)
+    out_shape = data.shape if out_shape is None else tuple(out_shape)
+    out_dtype = data.dtype if out_dtype is None else out_dtype
+    out_axis = axis if out_axis is None else out_axis
+    len_axis = data.shape[axis]
+    if nblocks is None:
+        nblocks = nthreads * 4
+    bounds = np.linspace(0, len_axis, min(nblocks, len_axis) + 1).astype(int)
+
+    in_slcs = []
+    out_slcs = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        in_slc = [slice(None)] * data.ndim
+        in_slc[axis] = slice(start, end)
+        out_slc = [slice(None)] * len(out_shape)
+        out_slc[out_axis] = slice(start, end)
+        in_slcs.append(tuple(in_slc))
+        out_slcs.append(tuple(out_slc))
+
+    if mode != 'process' or nthreads <= 1:
+        out = np.empty(out_shape, dtype=out_dtype)
+
+        def _map_view(slcs):
+            out[slcs[1]] = function(data[slcs[0]], **kwargs)
+
+        list(imap(_map_view, list(zip(in_slcs, out_slcs)),
+                  nthreads=nthreads, mode=mode, ordered=False))
+        return out
+
+    in_spec = _get_memmap_spec(data)
+    out_spec = _get_memmap_spec(shape=out_shape, dtype=out_dtype)
+    try:
+        args = [(function, in_spec, out_spec, in_slc, out_slc, kwargs)
+                for in_slc, out_slc in zip(in_slcs, out_slcs)]
+        list(imap(_map_block, args, nthreads=nthreads,
+                  mode='process', ordered=False))
+        out = np.array(_open_memmap(out_spec, mode='r'))
+    finally:
+        for spec in [in_spec, out_spec]:
+            if spec[-1] and os.path.exists(spec[0]):
+                os.remove(spec[0])
+    return out
 
 
 def report_err(save=None, comment=None, show=True):
@@ -861,6 +1816,200 @@ def report_err(save=None, comment=None, show=True):
             f.write('\n')
 
 
+def _start_record():
+    """
+    Starts timing (and tracing memory of) a profiled call.
+
+    :return record: (dict) - start time, traced memory and running peak
+    """
+    record = {'start': None, 'base': 0, 'peak': 0}
+    if PROFILE['memory'] and tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        if PROFILE['stack']:
+            parent = PROFILE['stack'][-1]
+            parent['peak'] = max(parent['peak'], peak)
+        tracemalloc.reset_peak()
+        record['base'] = current
+        record['peak'] = current
+    PROFILE['stack'].append(record)
+    record['start'] = time.perf_counter_ns()
+    return record
+
+
+def _stop_record(name, record):
+    """
+    Stops a profiled call and adds its time and peak memory to the stats.
+
+    :param name: (str) - name of the profiled function/block
+    :param record: (dict) - record returned by _start_record
+    """
+    elapsed = time.perf_counter_ns() - record['start']
+    PROFILE['stack'].pop()
+    peak = 0
+    if PROFILE['memory'] and tracemalloc.is_tracing():
+        record['peak'] = max(record['peak'],
+                             tracemalloc.get_traced_memory()[1])
+        peak = record['peak'] - record['base']
+        if PROFILE['stack']:
+            parent = PROFILE['stack'][-1]
+            parent['peak'] = max(parent['peak'], record['peak'])
+
+    stats = PROFILE['stats'].setdefault(name, {'times': [], 'peak': 0})
+    stats['times'].append(elapsed)
+    stats['peak'] = max(stats['peak'], peak)
+
+
+def profile(function=None, name=None):
+    """
+    Decorator that times each call of a function when profiling is
+    enabled; when disabled, it costs a single dict lookup.
+
+    :param function: (function) - function to profile
+    :param name: (str) - name to report; defaults to module.function
+    :return wrapper: (function) - profiled function
+    """
+    if function is None:
+        return partial(profile, name=name)
+    if name is None:
+        name = '{0}.{1}'.format(function.__module__.split('.')[-1],
+                                function.__name__)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not PROFILE['enabled']:
+            return function(*args, **kwargs)
+        record = _start_record()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _stop_record(name, record)
+    return wrapper
+
+
+@contextmanager
+def profiled(name):
+    """
+    Context manager that times a block of code when profiling is enabled.
+
+    :param name: (str) - name to report
+    """
+    if not PROFILE['enabled']:
+        yield
+        return
+    record = _start_record()
+    try:
+        yield
+    finally:
+        _stop_record(name, record)
+
+
+def enable_profiling(modules=('sci', 'ext', 'pre', 'vis'), memory=False):
+    """
+    Turns on profiling and wraps the public functions of the given ahh
+    modules (including names they imported from each other) so that
+    every call is timed; calls made inside process pools are not seen.
+
+    :param modules: (list) - names of ahh modules to instrument
+    :param memory: (boolean) - whether to track peak memory (tracemalloc);
+                               slows down allocations considerably
+    """
+    PROFILE['enabled'] = True
+    PROFILE['memory'] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        PROFILE['tracemalloc'] = True
+
+    loaded = []
+    for module_name in modules or []:
+        try:
+            loaded.append(importlib.import_module('ahh.' + module_name))
+        except Exception:
+            report_err(comment='Unable to profile {0}!'.format(module_name))
+
+    for module in loaded:
+        for attr, obj in list(vars(module).items()):
+            if (inspect.isfunction(obj) and not attr.startswith('_') and
+                    obj.__module__ == module.__name__ and
+                    attr not in PROFILE_SKIP and
+                    not inspect.isgeneratorfunction(obj) and
+                    id(obj) not in PROFILE['wrapped']):
+                PROFILE['wrapped'][id(obj)] = (obj, profile(obj))
+
+    for module in loaded:
+        for attr, obj in list(vars(module).items()):
+            if id(obj) in PROFILE['wrapped']:
+                original, wrapper = PROFILE['wrapped'][id(obj)]
+                if original is obj:
+                    setattr(module, attr, wrapper)
+                    PROFILE['patched'].append((module, attr, original))
+
+
+def disable_profiling(restore=True):
+    """
+    Turns off profiling; the collected stats are kept until reset.
+
+    :param restore: (boolean) - whether to unwrap the instrumented modules
+    """
+    PROFILE['enabled'] = False
+    if restore:
+        for module, attr, original in PROFILE['patched']:
+            setattr(module, attr, original)
+        PROFILE['patched'] = []
+        PROFILE['wrapped'] = {}
+    if PROFILE['tracemalloc']:
+        tracemalloc.stop()
+        PROFILE['tracemalloc'] = False
+    PROFILE['memory'] = False
+
+
+def reset_profile():
+    """
+    Clears the collected profiling stats.
+    """
+    PROFILE['stats'] = {}
+
+
+def get_profile(fmt='df', pcts=(50, 95), save=None):
+    """
+    Aggregates the collected profiling stats per function.
+
+    :param fmt: (str) - df for a pd.DataFrame, json for a str, else dict
+    :param pcts: (list) - percentiles of the call times to include
+    :param save: (str) - name of .json/.csv file to export the report to
+    :return report: (pd.DataFrame/str/dict) - calls, seconds and peak MB
+    """
+    report = {}
+    for name, stats in PROFILE['stats'].items():
+        times = np.array(stats['times']) / 1e9
+        row = {'calls': len(times),
+               'total_s': times.sum(),
+               'mean_s': times.mean()}
+        for pct, value in zip(pcts, np.percentile(times, pcts)):
+            row['p{0:g}_s'.format(pct)] = value
+        row['max_s'] = times.max()
+        row['peak_mb'] = stats['peak'] / 1e6
+        report[name] = row
+
+    df = pd.DataFrame.from_dict(report, orient='index')
+    if not df.empty:
+        df = df.sort_values('total_s', ascending=False)
+    if save is not None:
+        if save.endswith('.csv'):
+            df.to_csv(save)
+        else:
+            if '.json' not in save:
+                save += '.json'
+            with open(save, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if fmt == 'df':
+        return df
+    elif fmt == 'json':
+        return json.dumps(report, indent=2)
+    else:
+        return report
+
+
 def append_to_fn(fn, append_str):
     """
     Append string before the file ending
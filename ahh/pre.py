@@ -64,7 +64,7 @@ def wget_fi(fi_url, out_dir=None, user=None, pwd=None, quiet=False):
 def wget_list(fi_list, nthreads=1, out_dir=None, user=None, pwd=None):
     """
     Wrapper of wget_fi; allows downloading multiple files simulataneously
-    User/pwd doesn't work with more than 1 thread.
+    in threads.
 
     :param fi_list: (list) - list of file urls
     :param nthreads: (int) - number of files to download simulataneously
@@ -73,21 +73,11 @@ def wget_list(fi_list, nthreads=1, out_dir=None, user=None, pwd=None):
     :param pwd: (str) - password
     :return fi_list: (list) - list of downloaded files' paths
     """
-    out_list = []
-    if nthreads > 1:
-        if out_dir is not None:
-            current_dir = os.getcwd()
-            os.chdir(out_dir)
-        out_list = ext.parallelize(wget_fi, fi_list,
-                                   nthreads=nthreads)
-        if out_dir is not None:
-            os.chdir(current_dir)
-    else:
-        for fi in fi_list:
-            out_list.append(wget_fi(fi,
-                            out_dir=out_dir,
-                            user=user, pwd=pwd))
-    return out_list
+    if out_dir is not None:
+        mkdir(out_dir)
+    return ext.parallelize(wget_fi, fi_list, nthreads=nthreads,
+                           mode='thread', out_dir=out_dir,
+                           user=user, pwd=pwd)
 
 
 def gen_fi_list(fmt, start, end, freq='1D', **kwargs):
@@ -166,32 +156,44 @@ def concat_nc(glob_str, out_fi=None, in_dir='./', out_dir='./', rec_dim=None):
     return out_path
 
 
-def grb2nc(glob_str, in_dir='./', out_dir='./'):
+def _grb2nc_fi(fi_name, in_dir='./', out_dir='./'):
+    """
+    Creates a netCDF file from a grib file.
+
+    :param fi_name: (str) - path to grib file
+    :param in_dir: (str) - directory of input files
+    :param out_dir: (str) - directory of output files
+    :return fo_name: (str) - netCDF file's name
+    """
+    fo_name_dir = fi_name.replace(in_dir, out_dir)
+    if fi_name.endswith('.grb'):
+        fo_name = fo_name_dir.replace('.grb', '.nc')
+    elif fi_name.endswith('.grb2'):
+        fo_name = fo_name_dir.replace('.grb2', '.nc')
+    elif fi_name.endswith('.grib'):
+        fo_name = fo_name_dir.replace('.grib', '.nc')
+    elif fi_name.endswith('.grib2'):
+        fo_name = fo_name_dir.replace('.grib2', '.nc')
+    os.system("wgrib2 {fi_name} -netcdf {fo_name}".format(
+                                                          fi_name=fi_name,
+                                                          fo_name=fo_name))
+    return fo_name
+
+
+def grb2nc(glob_str, in_dir='./', out_dir='./', nthreads=1):
     """
     Creates netCDF files from grib files.
 
     :param glob_str: (str) - the naming pattern of the files
     :param in_dir: (str) - directory of input files
     :param out_dir: (str) - directory of output files
+    :param nthreads: (int) - number of files to convert simulataneously
     :return fo_names: (list) - list of netCDF files' names
     """
     fi_url = os.path.join(in_dir, glob_str)
     fi_names = sorted(glob.glob('{}'.format(fi_url)))
-    fo_names = []
-    for fi_name in fi_names:
-        fo_name_dir = fi_name.replace(in_dir, out_dir)
-        if fi_name.endswith('.grb'):
-            fo_name = fo_name_dir.replace('.grb', '.nc')
-        elif fi_name.endswith('.grb2'):
-            fo_name = fo_name_dir.replace('.grb2', '.nc')
-        elif fi_name.endswith('.grib'):
-            fo_name = fo_name_dir.replace('.grib', '.nc')
-        elif fi_name.endswith('.grib2'):
-            fo_name = fo_name_dir.replace('.grib2', '.nc')
-        os.system("wgrib2 {fi_name} -netcdf {fo_name}".format(
-                                                              fi_name=fi_name,
-                                                              fo_name=fo_name))
-        fo_names.append(fo_name)
+    fo_names = ext.parallelize(_grb2nc_fi, fi_names, nthreads=nthreads,
+                               mode='thread', in_dir=in_dir, out_dir=out_dir)
     if len(fo_names) == 1:
         return fo_names[0]
     else:
@@ -458,13 +460,13 @@ def join_cwd(path='', up=0, fp=True):
 
 def mkdir(dir_path):
     """
-    Creates a directory if it doesn't exist.
+    Creates a directory if it doesn't exist; safe to call from several
+    threads at once.
 
     :param dir_path: (str) - directory path
     :return dir_path: (str) - directory path
     """
-    if not os.path.exists(dir_path):
-        os.makedirs('{0}'.format(dir_path))
+    os.makedirs('{0}'.format(dir_path), exist_ok=True)
     return dir_path
 
 
@@ -1,133 +1,627 @@
 import numpy as np
-import operator
+import pandas as pd
 import xarray as xr
+import hashlib
+import os
 from ahh import ext
-from collections import Counter
 from scipy.stats.stats import pearsonr
+from scipy.stats import t as t_dist
 
 __author__ = 'huang.andrew12@gmail.com'
 __copyright__ = 'Andrew Huang'
 
 
-def get_uac(obs, fcst, clim):
+def _iter_chunks(len_arr, chunk=None):
     """
-    Calculates the uncentered anomaly correlation.
+    Yields slices along the first axis in steps of chunk.
+
+    :param len_arr: (int) - length of the first axis
+    :param chunk: (int) - number of steps per slice; all at once if None
+    :return slc: (slice) - slice of the first axis
+    """
+    if chunk is None or chunk < 1:
+        chunk = max(len_arr, 1)
+    for start in range(0, len_arr, chunk):
+        yield slice(start, min(start + chunk, len_arr))
+
+
+def _get_chunk(shape, chunk=None, size=1e6):
+    """
+    Picks the number of timesteps to read at once; by default as many as
+    fit in about size values so temporaries stay small and cache friendly.
+
+    :param shape: (tuple) - shape of the data
+    :param chunk: (int) - number of timesteps; the default is used if None
+    :param size: (int) - number of values per chunk by default
+    :return chunk: (int) - number of timesteps to read at once
+    """
+    if chunk is None:
+        chunk = max(1, int(size // max(np.prod(shape[1:]), 1)))
+    return chunk
+
+
+def get_uac(obs, fcst, clim, chunk=None):
+    """
+    Calculates the uncentered anomaly correlation. All timesteps are
+    reduced over the spatial axes at once, or chunk timesteps at a time
+    so memory-mapped arrays or netCDF4 variables are read slice by slice.
+    Masked grid points are left out; a NaN makes the timestep's score NaN.
 
     :param obs: (np.ma.array) - observation
     :param fcst: (np.ma.array) - forecast
     :param clim: (np.ma.array) - climatology
+    :param chunk: (int) - number of timesteps to read at once;
+                          about 1e6 values if None
     :return uac: (np.array) - uncentered anomaly correlation
     """
-    size_arr = obs.shape
-    len_arr = size_arr[0]
+    len_arr = obs.shape[0]
     uac = np.zeros(len_arr)
 
-    for i in range(len_arr):
-        fcst_prime = np.ma.array(fcst[i, :, :] - clim)
-        obs_prime = np.ma.array(obs[i, :, :] - clim)
-        numerator = np.sum(fcst_prime * obs_prime)
-        denominator = np.sum(
-            np.square(fcst_prime)) * np.sum(np.square(obs_prime))
-        uac[i] = numerator / np.sqrt(denominator)
+    for slc in _iter_chunks(len_arr, _get_chunk(obs.shape, chunk)):
+        fcst_prime = fcst[slc] - clim
+        obs_prime = obs[slc] - clim
+        flat_shp = (fcst_prime.shape[0], -1)
+        sums = _get_corr_sums(fcst_prime.reshape(flat_shp),
+                              obs_prime.reshape(flat_shp), _sum_points)
+        uac[slc] = _get_uac_from_sums(sums)
 
     return uac
 
 
-def get_cac(obs, fcst, clim, idc):
+def _is_region(region):
+    """
+    Checks whether an element of idc is a whole region on its own, i.e. a
+    (lat, lon) pair of index arrays/slices or a 2-D boolean mask, rather
+    than the lat or lon indices of a single region.
+
+    :param region: (tuple/list/np.array) - element of idc
+    :return is_region: (boolean) - whether it describes a region
+    """
+    if isinstance(region, np.ndarray):
+        return region.ndim > 1
+    if not isinstance(region, (tuple, list)) or len(region) != 2:
+        return False
+    return all(isinstance(item, (slice, tuple, list, np.ndarray))
+               for item in region)
+
+
+def _get_region_masks(idc, shape):
+    """
+    Builds a stack of flattened region masks from index boxes or masks.
+
+    :param idc: (tuple/list/np.array) - indices of grid points from
+                                        ext.get_idc, a list of them,
+                                        or boolean masks of the grid
+    :param shape: (tuple) - shape of the lat/lon grid
+    :return masks, single: (np.array, boolean) - (region, grid point) masks
+                                                 and whether one region given
+    """
+    npts = int(np.prod(shape))
+    if idc is None:
+        return np.ones((1, npts), dtype=bool), True
+
+    if isinstance(idc, np.ndarray) and idc.dtype == bool:
+        return idc.reshape(-1, npts), idc.ndim == len(shape)
+
+    single = not all(_is_region(region) for region in idc)
+    if single:
+        idc = [idc]
+
+    masks = np.zeros((len(idc),) + tuple(shape), dtype=bool)
+    for i, region in enumerate(idc):
+        if isinstance(region, np.ndarray) and region.dtype == bool:
+            masks[i] = region
+        else:
+            lat_slice, lon_slice = _idc2slices(region)
+            masks[i][np.ix_(np.arange(shape[0])[lat_slice],
+                            np.arange(shape[1])[lon_slice])] = True
+    return masks.reshape(-1, npts), single
+
+
+def _get_valid(data):
+    """
+    Finds the grid points that are not masked; the verification metrics
+    leave masked points out but let NaNs spoil the score.
+
+    :param data: (np.ma.array) - data
+    :return valid: (np.array) - boolean array of unmasked points
+    """
+    return ~np.ma.getmaskarray(data)
+
+
+def _sum_points(x, y=None):
+    """
+    Sums a (time, grid point) array, or the product of two without
+    building it, over the grid points.
+
+    :param x: (np.array) - (time, grid point) array
+    :param y: (np.array) - array to multiply x with
+    :return sums: (np.array) - sums per timestep
+    """
+    if y is None:
+        return np.sum(x, axis=1)
+    return np.einsum('ij,ij->i', x, y)
+
+
+def _get_corr_sums(fcst_prime, obs_prime, reduce):
+    """
+    Reduces anomalies into the moment sums of the anomaly correlations;
+    like np.ma, each field is centered and normalized over its own unmasked
+    points while the cross product uses the points unmasked in both. NaNs
+    are zeroed but counted so that only the regions holding them turn NaN.
+
+    :param fcst_prime: (np.ma.array) - (time, grid point) forecast anomaly
+    :param obs_prime: (np.ma.array) - (time, grid point) observation anomaly
+    :param reduce: (function) - sums an array, or the product of two
+                                arrays, over the grid points
+    :return sums: (dict) - moment sums of each field and of both
+    """
+    if np.ma.getmask(fcst_prime) is np.ma.nomask and \
+            np.ma.getmask(obs_prime) is np.ma.nomask:
+        return _get_full_corr_sums(np.ma.getdata(fcst_prime),
+                                   np.ma.getdata(obs_prime), reduce)
+
+    fcst_valid = _get_valid(fcst_prime)
+    obs_valid = _get_valid(obs_prime)
+    joint = fcst_valid & obs_valid
+    fcst_prime = np.where(fcst_valid, np.ma.getdata(fcst_prime), 0)
+    obs_prime = np.where(obs_valid, np.ma.getdata(obs_prime), 0)
+    nan = np.isnan(fcst_prime) | np.isnan(obs_prime)
+    fcst_prime[nan] = 0
+    obs_prime[nan] = 0
+    fcst_joint = fcst_prime * joint
+    return {'nan_n': reduce(nan),
+            'fcst_n': reduce(fcst_valid), 'obs_n': reduce(obs_valid),
+            'joint_n': reduce(joint),
+            'fcst': reduce(fcst_prime), 'obs': reduce(obs_prime),
+            'fcst_joint': reduce(fcst_joint),
+            'obs_joint': reduce(obs_prime, joint),
+            'fcst_sq': reduce(fcst_prime, fcst_prime),
+            'obs_sq': reduce(obs_prime, obs_prime),
+            'cross': reduce(fcst_joint, obs_prime)}
+
+
+def _get_full_corr_sums(fcst_prime, obs_prime, reduce):
+    """
+    Same as _get_corr_sums() for anomalies without masks, skipping the
+    bookkeeping of the valid points.
+
+    :param fcst_prime: (np.array) - (time, grid point) forecast anomaly
+    :param obs_prime: (np.array) - (time, grid point) observation anomaly
+    :param reduce: (function) - sums an array, or the product of two
+                                arrays, over the grid points
+    :return sums: (dict) - moment sums of each field and of both
+    """
+    fcst = reduce(fcst_prime)
+    obs = reduce(obs_prime)
+    nan = np.isnan(fcst) | np.isnan(obs)
+    if nan.any():
+        nan = np.isnan(fcst_prime) | np.isnan(obs_prime)
+        fcst_prime = np.where(nan, 0, fcst_prime)
+        obs_prime = np.where(nan, 0, obs_prime)
+        fcst = reduce(fcst_prime)
+        obs = reduce(obs_prime)
+        nan = reduce(nan)
+    count = reduce(np.ones((1, fcst_prime.shape[1])))
+    return {'nan_n': nan,
+            'fcst_n': count, 'obs_n': count, 'joint_n': count,
+            'fcst': fcst, 'obs': obs, 'fcst_joint': fcst, 'obs_joint': obs,
+            'fcst_sq': reduce(fcst_prime, fcst_prime),
+            'obs_sq': reduce(obs_prime, obs_prime),
+            'cross': reduce(fcst_prime, obs_prime)}
+
+
+def _get_uac_from_sums(sums):
+    """
+    Calculates the uncentered anomaly correlation from _get_corr_sums().
+
+    :param sums: (dict) - moment sums
+    :return uac: (np.array) - uncentered anomaly correlation
+    """
+    return np.where(sums['nan_n'] > 0, np.nan,
+                    sums['cross'] / np.sqrt(sums['fcst_sq'] * sums['obs_sq']))
+
+
+def _get_cac_from_sums(sums):
+    """
+    Calculates the centered anomaly correlation from _get_corr_sums().
+
+    :param sums: (dict) - moment sums
+    :return cac: (np.array) - centered anomaly correlation
+    """
+    fcst_avg = sums['fcst'] / sums['fcst_n']
+    obs_avg = sums['obs'] / sums['obs_n']
+    numerator = sums['cross'] - obs_avg * sums['fcst_joint'] - \
+        fcst_avg * sums['obs_joint'] + sums['joint_n'] * fcst_avg * obs_avg
+    denominator = (sums['fcst_sq'] - sums['fcst'] * fcst_avg) * \
+        (sums['obs_sq'] - sums['obs'] * obs_avg)
+    return np.where(sums['nan_n'] > 0, np.nan,
+                    numerator / np.sqrt(denominator))
+
+
+def get_cac(obs, fcst, clim, idc=None, chunk=None):
     """
-    Calculates the centered anomaly correlation.
+    Calculates the centered anomaly correlation. The fields are cropped to
+    the box bounding all regions and each anomaly field is computed once
+    per timestep; a single box is summed directly, several regions are
+    reduced against their masks at once. Masked grid points are left out;
+    a NaN within a region makes that region's score NaN for the timestep.
 
     :param obs: (np.ma.array) - observation
     :param fcst: (np.ma.array) - forecast
     :param clim: (np.ma.array) - climatology
+    :param idc: (np.array/list) - indices of grid points, a list of them,
+                                  or boolean (region, lat, lon) masks
+    :param chunk: (int) - number of timesteps to read at once;
+                         about 1e6 values if None
+    :return cac: (np.ma.array) - centered anomaly correlation with shape
+                                 (time) or (time, region) if several regions
+    """
+    len_arr = obs.shape[0]
+    grid_shp = np.shape(clim)[-2:]
+    masks, single = _get_region_masks(idc, grid_shp)
+    masks = masks.reshape((-1,) + tuple(grid_shp))
+
+    lat_slice, lon_slice = [
+        slice(idc[0], idc[-1] + 1) if len(idc) else slice(0, 0)
+        for idc in (np.flatnonzero(masks.any(axis=(0, 2))),
+                    np.flatnonzero(masks.any(axis=(0, 1))))]
+    masks = masks[:, lat_slice, lon_slice]
+    clim_box = clim[..., lat_slice, lon_slice]
+
+    if masks.shape[0] == 1 and masks.all():
+        reduce = _sum_points
+    else:
+        weights = masks.reshape(masks.shape[0], -1).T.astype(float)
+
+        def reduce(x, y=None):
+            if y is None:
+                return np.dot(x, weights)
+            return np.dot(x * y, weights)
+
+    cac = np.zeros((len_arr, masks.shape[0]))
+    chunk = _get_chunk((len_arr,) + clim_box.shape, chunk)
+    for slc in _iter_chunks(len_arr, chunk):
+        fcst_prime = fcst[slc, lat_slice, lon_slice] - clim_box
+        obs_prime = obs[slc, lat_slice, lon_slice] - clim_box
+        flat_shp = (fcst_prime.shape[0], -1)
+        sums = _get_corr_sums(fcst_prime.reshape(flat_shp),
+                              obs_prime.reshape(flat_shp), reduce)
+        cac[slc] = _get_cac_from_sums(sums).reshape(-1, masks.shape[0])
+
+    if single:
+        return cac[:, 0]
+    return cac
+
+
+def _idc2slice(idc):
+    """
+    Converts indices of one coordinate into an inclusive slice spanning
+    their min to max; slices from ext.get_idc(as_slice=True) pass through,
+    while the tuple of west and east slices/indices of a box crossing the
+    dateline (from get_idc(wrap=True)) becomes an array of their indices.
+
+    :param idc: (np.array/slice/tuple) - indices or slice(s)
+    :return slc: (slice/np.array) - slice spanning the indices, or indices
+    """
+    if isinstance(idc, slice):
+        return idc
+    elif isinstance(idc, tuple):
+        return np.concatenate([np.arange(part.start, part.stop)
+                               if isinstance(part, slice)
+                               else np.atleast_1d(part) for part in idc])
+    idc = np.atleast_1d(idc)
+    if len(idc) == 0:
+        return slice(0, 0)
+    return slice(idc.min(), idc.max() + 1)
+
+
+def _idc2slices(idc=None):
+    """
+    Converts lat/lon indices into a pair of inclusive slices; at most one
+    of them may be a dateline-crossing tuple, which becomes an index array.
+
+    :param idc: (np.array) - indices of grid points
+    :return lat_slice, lon_slice: (slice, slice) - slices of the lat/lon box
+    """
+    if idc is None:
+        return slice(None), slice(None)
+    lat_slice, lon_slice = _idc2slice(idc[0]), _idc2slice(idc[1])
+    if isinstance(lat_slice, np.ndarray) and \
+            isinstance(lon_slice, np.ndarray):
+        raise ValueError('Only the lon indices may cross the dateline; '
+                         'pass boolean masks of the grid instead!')
+    return lat_slice, lon_slice
+
+
+def _get_sq_err_sums(obs, fcst, idc=None, lats=None):
+    """
+    Sums the (cos-lat weighted) squared error over the lat/lon axes.
+
+    :param obs: (np.array) - observation
+    :param fcst: (np.array) - forecast
     :param idc: (np.array) - indices of grid points
-    :return cac: (np.ma.array) - centered anomaly correlation
-    """
-    size_arr = obs.shape
-    len_arr = size_arr[0]
-    cac = np.zeros(len_arr)
-
-    lat_start_idc = idc[0][0]
-    lat_end_idc = idc[0][-1]
-
-    lon_start_idc = idc[1][0]
-    lon_end_idc = idc[1][-1]
-
-    for i in range(len_arr):
-        fcst_prime = np.ma.array(
-            fcst[i, lat_start_idc:lat_end_idc + 1,
-                 lon_start_idc:lon_end_idc + 1] -
-            clim[lat_start_idc:lat_end_idc + 1,
-                 lon_start_idc:lon_end_idc + 1])
-        obs_prime = np.ma.array(
-            obs[i, lat_start_idc:lat_end_idc + 1,
-                lon_start_idc:lon_end_idc + 1] -
-            clim[lat_start_idc:lat_end_idc + 1,
-                 lon_start_idc:lon_end_idc + 1])
-
-        fcst_prime_avg = np.ma.average(
-            np.ma.array(
-                fcst[i, lat_start_idc:lat_end_idc + 1,
-                     lon_start_idc:lon_end_idc + 1] -
-                clim[lat_start_idc:lat_end_idc + 1,
-                     lon_start_idc:lon_end_idc + 1])
-            )
-        obs_prime_avg = np.ma.average(
-            np.ma.array(
-                obs[i, lat_start_idc:lat_end_idc + 1,
-                    lon_start_idc:lon_end_idc + 1] -
-                clim[lat_start_idc:lat_end_idc + 1,
-                     lon_start_idc:lon_end_idc + 1])
-            )
-
-        numerator = np.sum((
-            fcst_prime - fcst_prime_avg) * (obs_prime - obs_prime_avg))
-        denominator = np.sum(np.square(fcst_prime - fcst_prime_avg)) * \
-            np.sum(np.square(obs_prime - obs_prime_avg))
-        cac[i] = numerator / np.sqrt(denominator)
+    :param lats: (np.array) - latitudes to weight by; unweighted if None
+    :return sq_err, weight: (np.array, np.array) - sums per leading index
+    """
+    lat_slice, lon_slice = _idc2slices(idc)
+    sq_err = np.ma.array(np.square(fcst[..., lat_slice, lon_slice] -
+                                   obs[..., lat_slice, lon_slice]))
+    valid = ~np.ma.getmaskarray(sq_err)
 
-    return cac
+    if lats is None:
+        wgts = np.ones(sq_err.shape[-2:])
+    else:
+        coslat = ext.get_grid(lats)['coslat'][lat_slice]
+        wgts = np.broadcast_to(coslat[:, None], sq_err.shape[-2:])
+
+    axis = (-2, -1)
+    return (np.sum(sq_err.filled(0) * wgts, axis=axis),
+            np.sum(valid * wgts, axis=axis))
 
 
-def get_rmse(obs, fcst, idc):
+def get_rmse(obs, fcst, idc=None, lats=None, chunk=None):
     """
-    Calculates the root mean square error.
+    Calculates the root mean square error of each timestep, averaged over
+    the grid points within idc and optionally weighted by cos(latitude).
+    Masked grid points are left out; a NaN makes the timestep's score NaN.
 
     :param obs: (np.array) - observation
     :param fcst: (np.array) - forecast
     :param idc: (np.array) - indices of grid points
+    :param lats: (np.array) - latitudes for area weighting
+    :param chunk: (int) - number of timesteps to read at once
     :return rmse: (np.array) - root mean square error
     """
-    size_arr = obs.shape
-    len_arr = size_arr[0]
-    grid_points = size_arr[1] * size_arr[2]
+    len_arr = obs.shape[0]
     rmse = np.zeros(len_arr)
 
-    lat_start_idc = idc[0][0]
-    lat_end_idc = idc[0][-1]
-
-    lon_start_idc = idc[1][0]
-    lon_end_idc = idc[1][-1]
-
-    for i in range(len_arr):
-        rmse[i] = np.sqrt(
-            (1 / grid_points) *
-            np.sum(
-                np.square(
-                    fcst[
-                        i,
-                        lat_start_idc:lat_end_idc + 1,
-                        lon_start_idc:lon_end_idc + 1] -
-                    obs[
-                        i,
-                        lat_start_idc:lat_end_idc + 1,
-                        lon_start_idc:lon_end_idc + 1]
-                       )
-                   )
-             )
+    for slc in _iter_chunks(len_arr, chunk):
+        sq_err, weight = _get_sq_err_sums(obs[slc], fcst[slc],
+                                          idc=idc, lats=lats)
+        rmse[slc] = np.sqrt(sq_err / weight)
+
     return rmse
 
 
+def accum_rmse(obs, fcst, sums=None, idc=None, lats=None):
+    """
+    Updates running sums of (weighted) squared error and weights
+    with another file or chunk; pass the result to finish_rmse().
+
+    :param obs: (np.array) - observation chunk
+    :param fcst: (np.array) - forecast chunk
+    :param sums: (dict) - sums returned by a previous accum_rmse()
+    :param idc: (np.array) - indices of grid points
+    :param lats: (np.array) - latitudes for area weighting
+    :return sums: (dict) - updated sums of sq_err and weight
+    """
+    if sums is None:
+        sums = {'sq_err': 0., 'weight': 0.}
+    sq_err, weight = _get_sq_err_sums(obs, fcst, idc=idc, lats=lats)
+    sums['sq_err'] += np.sum(sq_err)
+    sums['weight'] += np.sum(weight)
+    return sums
+
+
+def finish_rmse(sums):
+    """
+    Calculates the root mean square error from accumulated sums.
+
+    :param sums: (dict) - sums returned by accum_rmse()
+    :return rmse: (float) - root mean square error
+    """
+    return np.sqrt(sums['sq_err'] / sums['weight'])
+
+
+METRICS = ['uac', 'cac', 'rmse', 'bias', 'mae']
+
+
+def get_verif(obs, fcst, clim, idc=None, lats=None, chunk=None):
+    """
+    Calculates the uncentered and centered anomaly correlation, root mean
+    square error, bias and mean absolute error of each timestep in one
+    pass; anomalies and errors are computed once per chunk and shared.
+    Errors are weighted by cos(latitude) if lats is given. Like the single
+    metrics, masked grid points are left out and a NaN makes the
+    timestep's scores NaN.
+
+    :param obs: (np.ma.array) - observation
+    :param fcst: (np.ma.array) - forecast
+    :param clim: (np.ma.array) - climatology
+    :param idc: (np.array) - indices of grid points
+    :param lats: (np.array) - latitudes for area weighting
+    :param chunk: (int) - number of timesteps to read at once
+    :return scores: (dict) - arrays of each metric in METRICS
+    """
+    len_arr = obs.shape[0]
+    lat_slice, lon_slice = _idc2slices(idc)
+    clim_box = clim[..., lat_slice, lon_slice]
+    scores = {metric: np.zeros(len_arr) for metric in METRICS}
+
+    for slc in _iter_chunks(len_arr, chunk):
+        fcst_prime = np.ma.array(fcst[slc, ..., lat_slice, lon_slice] -
+                                 clim_box)
+        obs_prime = np.ma.array(obs[slc, ..., lat_slice, lon_slice] -
+                                clim_box)
+        axis = tuple(range(1, fcst_prime.ndim))
+        flat_shp = (fcst_prime.shape[0], -1)
+        sums = _get_corr_sums(fcst_prime.reshape(flat_shp),
+                              obs_prime.reshape(flat_shp), _sum_points)
+        scores['uac'][slc] = _get_uac_from_sums(sums)
+        scores['cac'][slc] = _get_cac_from_sums(sums)
+
+        valid = _get_valid(fcst_prime) & _get_valid(obs_prime)
+        err = np.where(valid, np.ma.getdata(fcst_prime) -
+                       np.ma.getdata(obs_prime), 0)
+        if lats is None:
+            wgts = valid
+        else:
+            wgts = valid * ext.get_grid(lats)['coslat'][lat_slice][:, None]
+        wgt_sum = np.sum(wgts, axis=axis)
+        scores['rmse'][slc] = np.sqrt(
+            np.sum(wgts * np.square(err), axis=axis) / wgt_sum)
+        scores['bias'][slc] = np.sum(wgts * err, axis=axis) / wgt_sum
+        scores['mae'][slc] = np.sum(wgts * np.abs(err), axis=axis) / wgt_sum
+
+    return scores
+
+
+def _get_shared_spec(data):
+    """
+    Places a (masked) array once in shared memory-mapped files so worker
+    processes open it instead of each receiving a pickled copy.
+
+    :param data: (np.ma.array) - array to share
+    :return spec: (tuple) - memmap specs of the data and of the mask
+                            (None if unmasked)
+    """
+    data = np.asanyarray(data)
+    mask = np.ma.getmask(data)
+    return (ext._get_memmap_spec(np.ma.getdata(data)),
+            None if mask is np.ma.nomask else ext._get_memmap_spec(mask))
+
+
+def _open_shared(spec):
+    """
+    Opens an array placed by _get_shared_spec().
+
+    :param spec: (tuple) - memmap specs of the data and of the mask
+    :return data: (np.ma.array) - read-only memory-mapped array
+    """
+    data_spec, mask_spec = spec
+    data = ext._open_memmap(data_spec)
+    if mask_spec is None:
+        return data
+    return np.ma.array(data, mask=ext._open_memmap(mask_spec))
+
+
+def _get_lead_verif(args):
+    """
+    Runs get_verif for one lead time; used by get_verif_df.
+
+    :param args: (tuple) - lead and forecast, shared specs of observation
+                           and climatology, and keyword arguments
+    :return lead, scores: (scalar, dict) - lead time and its scores
+    """
+    (lead, fcst), obs_spec, clim_spec, kwargs = args
+    return lead, get_verif(_open_shared(obs_spec), fcst,
+                           _open_shared(clim_spec), **kwargs)
+
+
+def get_verif_df(obs, fcsts, clim, times=None, nthreads=1, **kwargs):
+    """
+    Verifies forecasts of several lead times, optionally in parallel
+    processes, and tidies all scores into a dataframe. In parallel, the
+    observation and climatology are placed once in shared memory-mapped
+    files rather than pickled into every lead's task.
+
+    :param obs: (np.ma.array) - observation
+    :param fcsts: (dict) - forecasts keyed by lead time
+    :param clim: (np.ma.array) - climatology
+    :param times: (arr) - times of the first axis; indices if None
+    :param nthreads: (int) - number of processes to use
+    :param kwargs: (kwargs) - idc, lats, or chunk passed to get_verif
+    :return df: (pd.DataFrame) - lead, time, metric and score columns
+    """
+    items = list(fcsts.items())
+    if nthreads > 1:
+        specs = [_get_shared_spec(obs), _get_shared_spec(clim)]
+        try:
+            results = ext.parallelize(_get_lead_verif, items,
+                                      nthreads=nthreads, arg2=specs[0],
+                                      arg3=specs[1], arg4=kwargs)
+        finally:
+            for spec in [spec for pair in specs for spec in pair
+                         if spec is not None]:
+                if spec[-1] and os.path.exists(spec[0]):
+                    os.remove(spec[0])
+    else:
+        results = [(lead, get_verif(obs, fcst, clim, **kwargs))
+                   for lead, fcst in items]
+
+    if times is None:
+        times = np.arange(obs.shape[0])
+    df_list = []
+    for lead, scores in results:
+        df = pd.DataFrame(scores, columns=METRICS)
+        df.insert(0, 'time', times)
+        df.insert(0, 'lead', lead)
+        df_list.append(df)
+    return pd.concat(df_list, ignore_index=True).melt(
+        id_vars=['lead', 'time'], var_name='metric', value_name='score')
+
+
+class UnitMismatch(Exception):
+    pass
+
+
+UNITS = {'k': ('temperature', 1., 0.),
+         'c': ('temperature', 1., 273.15),
+         'f': ('temperature', 5. / 9., 273.15 - 32. * 5. / 9.),
+         'm': ('length', 1., 0.),
+         'mm': ('length', 0.001, 0.),
+         'cm': ('length', 0.01, 0.),
+         'km': ('length', 1000., 0.),
+         'in': ('length', 0.0254, 0.),
+         'ft': ('length', 0.3048, 0.),
+         'mi': ('length', 1609.344, 0.),
+         'mps': ('speed', 1., 0.),
+         'kph': ('speed', 1. / 3.6, 0.),
+         'mph': ('speed', 1609.344 / 3600., 0.),
+         'kt': ('speed', 1852. / 3600., 0.),
+         'pa': ('pressure', 1., 0.),
+         'hpa': ('pressure', 100., 0.),
+         'mb': ('pressure', 100., 0.),
+         'inhg': ('pressure', 3386.389, 0.),
+         }
+
+
+def add_unit(name, quantity, scale=1., offset=0.):
+    """
+    Registers a unit as an affine function of its quantity's base unit,
+    i.e. base = scale * value + offset.
+
+    :param name: (str) - name of unit
+    :param quantity: (str) - type of quantity, e.g. temperature
+    :param scale: (scalar) - multiplier to the base unit
+    :param offset: (scalar) - offset to the base unit
+    """
+    UNITS[name.lower()] = (quantity, float(scale), float(offset))
+
+
+def _snap_float(x):
+    """
+    Trims round-off left from composing through a base unit (e.g. turns
+    1.7999999999999998 into 1.8) without touching genuine digits.
+
+    :param x: (float) - value
+    :return x: (float) - snapped value
+    """
+    snapped = float('{0:.12g}'.format(x))
+    if abs(snapped - x) <= 1e-14 * max(abs(x), 1.):
+        return snapped
+    return x
+
+
+def get_conversion(from_unit, to_unit):
+    """
+    Composes the conversion between two units into one multiply-add.
+
+    :param from_unit: (str) - name of the original unit
+    :param to_unit: (str) - name of the new unit
+    :return scale, offset: (float, float) - new = scale * old + offset
+    """
+    from_qty, from_scale, from_offset = UNITS[from_unit.lower()]
+    to_qty, to_scale, to_offset = UNITS[to_unit.lower()]
+    if from_qty != to_qty:
+        raise UnitMismatch('Cannot convert {0} ({1}) to {2} ({3})!'
+                           .format(from_unit, from_qty, to_unit, to_qty))
+    scale = from_scale / to_scale
+    offset = (from_offset - to_offset) / to_scale
+    return _snap_float(scale), _snap_float(offset)
+
+
 def convert(variable,
             mm2in=False,
             c2f=False,
@@ -135,10 +629,15 @@ def convert(variable,
             f2k=False,
             mps2mph=False,
             km2mi=False,
-            reverse=False
+            reverse=False,
+            from_unit=None,
+            to_unit=None,
+            out=None
             ):
     """
-    Converts the variable from one unit to another.
+    Converts the variable from one unit to another with a single
+    multiply-add. Dask/xarray variables stay lazy and out= allows
+    converting large arrays in place (out=variable).
 
     :param variable: (np.array) - variable values
     :param mm2in: (boolean) - millimeters to inches
@@ -146,62 +645,224 @@ def convert(variable,
     :param c2k: (boolean) - Celsius to Kelvin
     :param f2k: (boolean) - Fahrenheit to Kelvin
     :param mps2mph: (boolean) - meters per second to miles per hour
+    :param km2mi: (boolean) - kilometers to miles
     :param reverse: (boolean) - reverses the conversions (mm2in becomes in2mm)
+    :param from_unit: (str) - name of original unit in UNITS
+    :param to_unit: (str) - name of new unit in UNITS
+    :param out: (np.array) - array to store the result in
     :return conv_var: (np.array) - converted variable values
     """
-    np_var = np.array(variable)
-    if not reverse:
-        if mm2in:
-            conv_var = np_var / 25.4
-        elif c2f:
-            conv_var = np_var * 1.8 + 32
-        elif c2k:
-            conv_var = np.var + 273.15
-        elif f2k:
-            conv_var = np_var * 1.8 + 32 + 273.15
-        elif mps2mph:
-            conv_var = np_var / 1609.344 * 3600
-        elif km2mi:
-            conv_var = np_var * 0.621371
-    elif reverse:
-        if mm2in:
-            conv_var = np_var * 25.4
-        elif c2f:
-            conv_var = (np_var - 32) / 1.8
-        elif c2k:
-            conv_var = np.var - 273.15
-        elif f2k:
-            conv_var = (np_var - 32) / 1.8 - 273.15
-        elif mps2mph:
-            conv_var = np_var * 1609.344 / 3600
-        elif km2mi:
-            conv_var = np_var / 0.621371
+    flags = [(mm2in, 'mm', 'in'), (c2f, 'c', 'f'), (c2k, 'c', 'k'),
+             (f2k, 'f', 'k'), (mps2mph, 'mps', 'mph'), (km2mi, 'km', 'mi')]
+    for flag, flag_from, flag_to in flags:
+        if flag:
+            from_unit, to_unit = flag_from, flag_to
+            break
+    if reverse:
+        from_unit, to_unit = to_unit, from_unit
+
+    scale, offset = get_conversion(from_unit, to_unit)
+
+    if out is not None:
+        np.multiply(variable, scale, out=out)
+        if offset:
+            np.add(out, offset, out=out)
+        return out
+
+    if isinstance(variable, (list, tuple)):
+        variable = np.array(variable)
+    conv_var = variable * scale
+    if offset:
+        if isinstance(conv_var, np.ndarray) and conv_var.ndim > 0:
+            np.add(conv_var, offset, out=conv_var)
+        else:
+            conv_var = conv_var + offset
     return conv_var
 
 
-def get_norm_anom(data_avg):
+def _get_clim_key(fi_list=None, data=None, times=None, period=None,
+                  freq='doy', nharm=None, name=None):
+    """
+    Hashes the input files (paths, sizes, modification times), or the
+    data's shape, dtype and values, along with the times, period and the
+    name telling apart what was read from the same files.
+
+    :param fi_list: (list) - list of input file paths
+    :param data: (np.array) - data to hash if no fi_list
+    :param times: (arr) - array of datetimes matching the first axis
+    :param period: (tuple) - start and end of the climatological period
+    :param freq: (str) - doy or month
+    :param nharm: (int) - number of harmonics kept
+    :param name: (str) - variable/level/region read from fi_list
+    :return key: (str) - md5 hex digest
+    """
+    md5 = hashlib.md5()
+    if fi_list is not None:
+        for fi in sorted(fi_list):
+            fi_stat = os.stat(fi)
+            md5.update('{0}|{1}|{2}'.format(os.path.abspath(fi),
+                                            fi_stat.st_size,
+                                            fi_stat.st_mtime).encode())
+    else:
+        data = np.ascontiguousarray(np.ma.filled(data, np.nan))
+        md5.update('{0}|{1}'.format(data.shape, data.dtype.str).encode())
+        md5.update(memoryview(data).cast('B'))
+    if times is not None:
+        md5.update(np.asarray(pd.DatetimeIndex(times).asi8).tobytes())
+    md5.update('{0}|{1}|{2}|{3}'.format(period, freq, nharm,
+                                        name).encode())
+    return md5.hexdigest()
+
+
+def _get_clim_keys(times, freq='doy'):
     """
-    Finds the normalized anomaly of some averaged data.
+    Gets the zero-based climatology index of each time; days of year
+    follow a 365 day calendar with Feb 29 folded into Feb 28 so leap
+    and non-leap years stay aligned.
+
+    :param times: (arr) - array of datetimes
+    :param freq: (str) - doy or month
+    :return keys: (np.array) - day of year - 1 (0-364) or month - 1
+    """
+    times = pd.DatetimeIndex(times)
+    if freq == 'month':
+        return np.asarray(times.month) - 1
+    doys = np.asarray(times.dayofyear)
+    after_feb28 = np.asarray(times.is_leap_year) & (doys >= 60)
+    return doys - 1 - after_feb28
+
+
+def get_harm_fit(data, nharm=3, axis=0):
+    """
+    Smooths a periodic series by keeping only its leading harmonics.
+
+    :param data: (np.array) - periodic data such as a climatology
+    :param nharm: (int) - number of harmonics to keep (besides the mean)
+    :param axis: (int) - axis of the period
+    :return smoothed: (np.array) - harmonic fit
+    """
+    nans = np.isnan(data)
+    if nans.any():
+        data = np.where(nans, np.nanmean(data, axis=axis, keepdims=True),
+                        data)
+    coefs = np.fft.rfft(data, axis=axis)
+    slices = [slice(None)] * np.ndim(data)
+    slices[axis] = slice(nharm + 1, None)
+    coefs[tuple(slices)] = 0
+    return np.fft.irfft(coefs, n=np.shape(data)[axis], axis=axis)
+
+
+def get_clim(data, times=None, freq='doy', nharm=None,
+             period=None, fi_list=None, cache_dir=None, name=None):
+    """
+    Computes a day of year or monthly mean and std climatology, optionally
+    smoothed by a harmonic fit. If cache_dir is given, the climatology
+    is saved there keyed by a hash of fi_list and name (or of data's values
+    if fi_list is None), times and period, and later calls load it instead
+    of computing it again; fi_list is required if data is a function, and
+    name is required with fi_list since the same files may hold several
+    variables, levels or regions.
+
+    :param data: (np.array/function) - (time, ...) data, or a function
+                                       returning (data, times) that is
+                                       only called if not cached
+    :param times: (arr) - array of datetimes matching the first axis
+    :param freq: (str) - doy or month
+    :param nharm: (int) - number of harmonics to keep; no smoothing if None
+    :param period: (tuple) - start and end of the climatological period
+    :param fi_list: (list) - input files the data was read from
+    :param cache_dir: (str) - directory to cache climatologies in
+    :param name: (str) - variable/level/region read from fi_list,
+                         e.g. 'air_850_nh'
+    :return clim: (dict) - freq, mean, and std of the climatology
+    """
+    cache_path = None
+    if cache_dir is not None:
+        if callable(data) and fi_list is None:
+            raise ValueError('fi_list is required to cache the climatology '
+                             'of data loaded by a function!')
+        if fi_list is not None and name is None:
+            raise ValueError('name is required to cache the climatology '
+                             'of data read from fi_list!')
+        key = _get_clim_key(fi_list=fi_list,
+                            data=None if callable(data) else data,
+                            times=times, period=period,
+                            freq=freq, nharm=nharm, name=name)
+        cache_path = os.path.join(cache_dir, 'clim_{0}.npz'.format(key))
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return {'freq': str(cached['freq']),
+                        'mean': cached['mean'],
+                        'std': cached['std']}
+
+    if callable(data):
+        data, times = data()
+
+    if period is not None:
+        times = pd.DatetimeIndex(times)
+        period_idc = np.where((times >= pd.Timestamp(period[0])) &
+                              (times <= pd.Timestamp(period[1])))[0]
+        data = data[period_idc.min():period_idc.max() + 1]
+        times = times[period_idc.min():period_idc.max() + 1]
+
+    keys = _get_clim_keys(times, freq=freq)
+    nkeys = 12 if freq == 'month' else 365
+    data = np.ma.filled(data, np.nan)
+    clim_mean = np.full((nkeys,) + data.shape[1:], np.nan)
+    clim_std = np.full((nkeys,) + data.shape[1:], np.nan)
+    for key in np.unique(keys):
+        key_data = data[keys == key]
+        clim_mean[key] = np.nanmean(key_data, axis=0)
+        clim_std[key] = np.nanstd(key_data, axis=0)
+
+    if nharm is not None:
+        clim_mean = get_harm_fit(clim_mean, nharm=nharm)
+        clim_std = get_harm_fit(clim_std, nharm=nharm)
+
+    clim = {'freq': freq, 'mean': clim_mean, 'std': clim_std}
+    if cache_path is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        np.savez(cache_path, **clim)
+    return clim
+
+
+def get_norm_anom(data_avg, clim=None, times=None):
+    """
+    Finds the normalized anomaly of some averaged data, either from its
+    overall mean and std or from a climatology given by get_clim().
 
     :param data_avg: (np.ma.array) - average data values
+    :param clim: (dict) - climatology from get_clim()
+    :param times: (arr) - datetimes of data_avg's first axis if clim
     :return data_anom: (arr) - normalized anomaly
     """
-    data_std = np.std(data_avg)
-    data_clim = np.mean(data_avg)
-    data_anom = np.zeros_like(data_avg)
+    if clim is None:
+        data_std = np.std(data_avg)
+        data_clim = np.mean(data_avg)
+    else:
+        keys = _get_clim_keys(times, freq=clim['freq'])
+        data_std = clim['std'][keys]
+        data_clim = clim['mean'][keys]
     data_anom = (data_avg - data_clim) / data_std
     return data_anom
 
 
-def get_anom(data):
+def get_anom(data, clim=None, times=None):
     """
     Finds the anomaly by taking the difference
-    between actual and mean.
+    between actual and mean, or a climatology given by get_clim().
 
     :param data: (np.ma.array) - data values
+    :param clim: (dict) - climatology from get_clim()
+    :param times: (arr) - datetimes of data's first axis if clim
     :return data_anom: (arr) - anomaly
     """
-    data_clim = np.mean(data)
+    if clim is None:
+        data_clim = np.mean(data)
+    else:
+        keys = _get_clim_keys(times, freq=clim['freq'])
+        data_clim = clim['mean'][keys]
     data_anom = data - data_clim
     return data_anom
 
@@ -216,164 +877,214 @@ def get_norm(data):
     return (data - np.min(data)) / (np.max(data) - np.min(data))
 
 
+def _get_bounds_slice(coord, lower, upper):
+    """
+    Finds the slice of a coordinate within the given bounds (inclusive).
+
+    :param coord: (np.array) - coordinate values
+    :param lower: (scalar) - lower boundary
+    :param upper: (scalar) - upper boundary
+    :return slc: (slice) - slice spanning the coordinate values in bounds
+    """
+    coord = np.asarray(coord)
+    idc = np.where((coord >= min(lower, upper)) &
+                   (coord <= max(lower, upper)))[0]
+    if len(idc) == 0:
+        print('Unable to find any indices within the range!')
+        return slice(0, 0)
+    return slice(idc.min(), idc.max() + 1)
+
+
 def get_avg(data, axis=(0),
             times_idc=None,
             lats_idc=None,
             lons_idc=None,
             lvls_idc=None,
-            change_lvl_order=False):
+            change_lvl_order=False,
+            dims=None,
+            coords=None,
+            bounds=None,
+            weight=False):
     """
-    Finds the areal and/or time average and/or level, but first,
-    data dimensions must be in these orders:
+    Finds the areal and/or time average and/or level over a view of the
+    data. Dimensions are named by dims (or taken from an xr.DataArray);
+    otherwise data dimensions must be in these orders:
     lat, lon;
     time, lat, lon;
     time, level, lat, lon OR time, lat, lon, level (if change_lvl_order).
+    The default names are time, lvl, lat, and lon.
 
-    :param data: (np.ma.array) - input data
-    :param axis: (tuple) - axis to average over
+    :param data: (np.ma.array/xr.DataArray) - input data
+    :param axis: (tuple) - axis (indices or dim names) to average over;
+                           all axes if None
     :param times_idc: (np.array) - time indices
-    :param lats_idc: (np.array) - latitude indices
-    :param lons_idc: (np.array) - longitude indices
+    :param lats_idc: (np.array) - latitude indices; spanned from min to max
+    :param lons_idc: (np.array/tuple) - longitude indices, spanned from min
+                                        to max, or the tuple of
+                                        get_idc(wrap=True) for a box
+                                        crossing the dateline
     :param lvls_idc: (float) - level indices
     :param change_lvl_order: (boolean) - changes order of level dimension
-    :return avg: (np.ma.array) - average over given parameters
+    :param dims: (tuple) - names of each data dimension
+    :param coords: (dict) - coordinate values keyed by dim name
+    :param bounds: (dict) - lower and upper coordinate bounds keyed by dim
+    :param weight: (boolean) - whether to weight by cos(latitude)
+    :return avg: (np.ma.array/xr.DataArray) - average over given parameters
     """
-    data_shp = data.shape
-
-    if len(data_shp) == 2:
-        if lats_idc is None:
-            lat_start_idc = 0
-            lat_end_idc = data_shp[0]
+    da = None
+    if isinstance(data, xr.DataArray):
+        da = data
+        dims = da.dims
+        coords = dict({dim: da[dim].values for dim in dims
+                       if dim in da.coords}, **(coords or {}))
+        data = da.data
+
+    ndim = np.ndim(data)
+    if dims is None:
+        if ndim == 2:
+            dims = ('lat', 'lon')
+        elif ndim == 3:
+            dims = ('time', 'lat', 'lon')
+        elif ndim == 4 and change_lvl_order:
+            dims = ('time', 'lat', 'lon', 'lvl')
+        elif ndim == 4:
+            dims = ('time', 'lvl', 'lat', 'lon')
         else:
-            lat_start_idc = lats_idc.min()
-            lat_end_idc = lats_idc.max()
-        if lons_idc is None:
-            lon_start_idc = 0
-            lon_end_idc = data_shp[1]
-        else:
-            lon_start_idc = lons_idc.min()
-            lon_end_idc = lons_idc.max()
-        return np.ma.average(np.ma.array(data[
-                               lat_start_idc:lat_end_idc + 1,
-                               lon_start_idc:lon_end_idc + 1
-                               ]),
-                             axis=axis)
-
-    if len(data_shp) == 3:
-        if times_idc is None:
-            time_start_idc = 0
-            time_end_idc = data_shp[0]
-        else:
-            time_start_idc = times_idc.min()
-            time_end_idc = times_idc.max()
-        if lats_idc is None:
-            lat_start_idc = 0
-            lat_end_idc = data_shp[1]
-        else:
-            lat_start_idc = lats_idc.min()
-            lat_end_idc = lats_idc.max()
-        if lons_idc is None:
-            lon_start_idc = 0
-            lon_end_idc = data_shp[2]
-        else:
-            lon_start_idc = lons_idc.min()
-            lon_end_idc = lons_idc.max()
-        return np.ma.average(np.ma.array(data[
-                               time_start_idc:time_end_idc + 1,
-                               lat_start_idc:lat_end_idc + 1,
-                               lon_start_idc:lon_end_idc + 1
-                               ]),
-                             axis=axis)
-
-    if len(data_shp) == 4:
-        if change_lvl_order:
-            if times_idc is None:
-                time_start_idc = 0
-                time_end_idc = data_shp[0]
-            else:
-                time_start_idc = times_idc.min()
-                time_end_idc = times_idc.max()
-            if lats_idc is None:
-                lat_start_idc = 0
-                lat_end_idc = data_shp[1]
-            else:
-                lat_start_idc = lats_idc.min()
-                lat_end_idc = lats_idc.max()
-            if lons_idc is None:
-                lon_start_idc = 0
-                lon_end_idc = data_shp[2]
-            else:
-                lon_start_idc = lons_idc.min()
-                lon_end_idc = lons_idc.max()
-            if lvls_idc is None:
-                lvl_start_idc = 0
-                lvl_end_idc = data_shp[3]
-            else:
-                lvl_start_idc = lvls_idc.min()
-                lvl_end_idc = lvls_idc.max()
-            return np.ma.average(np.ma.array(data[
-                                   time_start_idc:time_end_idc + 1,
-                                   lat_start_idc:lat_end_idc + 1,
-                                   lon_start_idc:lon_end_idc + 1,
-                                   lvl_start_idc:lvl_end_idc + 1,
-                                   ]),
-                                 axis=axis)
-        else:
-            if times_idc is None:
-                time_start_idc = 0
-                time_end_idc = data_shp[0]
-            else:
-                time_start_idc = times_idc.min()
-                time_end_idc = times_idc.max()
-            if lvls_idc is None:
-                lvl_start_idc = 0
-                lvl_end_idc = data_shp[1]
-            else:
-                lvl_start_idc = lvls_idc.min()
-                lvl_end_idc = lvls_idc.max()
-            if lats_idc is None:
-                lat_start_idc = 0
-                lat_end_idc = data_shp[2]
-            else:
-                lat_start_idc = lats_idc.min()
-                lat_end_idc = lats_idc.max()
-            if lons_idc is None:
-                lon_start_idc = 0
-                lon_end_idc = data_shp[3]
-            else:
-                lon_start_idc = lons_idc.min()
-                lon_end_idc = lons_idc.max()
-            return np.ma.average(np.ma.array(data[
-                                   time_start_idc:time_end_idc + 1,
-                                   lvl_start_idc:lvl_end_idc + 1,
-                                   lat_start_idc:lat_end_idc + 1,
-                                   lon_start_idc:lon_end_idc + 1,
-                                   ]),
-                                 axis=axis)
-
-
-def get_stats(data, show=True, return_str='vertical'):
-    """
-    Get basic stats of an array.
+            dims = tuple('dim_{0}'.format(i) for i in range(ndim))
+    dims = tuple(dims)
+    coords = coords or {}
+    bounds = bounds or {}
+
+    dims_idc = {'time': times_idc, 'lvl': lvls_idc,
+                'lat': lats_idc, 'lon': lons_idc}
+    slices = [slice(None)] * ndim
+    for i, dim in enumerate(dims):
+        if dim in bounds:
+            slices[i] = _get_bounds_slice(coords[dim], *bounds[dim])
+        elif dims_idc.get(dim) is not None:
+            slices[i] = _idc2slice(dims_idc[dim])
+    view = data[tuple(slc if isinstance(slc, slice) else slice(None)
+                      for slc in slices)]
+    for i, slc in enumerate(slices):
+        if not isinstance(slc, slice):
+            view = view[(slice(None),) * i + (slc,)]
+
+    if axis is None:
+        axis = tuple(range(ndim))
+    else:
+        axis = np.atleast_1d(axis).tolist()
+        axis = tuple(dims.index(ax) if ax in dims else int(ax) % ndim
+                     for ax in axis)
+
+    wgts = None
+    if weight:
+        lat_dim = [dim for dim in dims if dim.startswith('lat')][0]
+        lat_axis = dims.index(lat_dim)
+        shape = [1] * ndim
+        shape[lat_axis] = view.shape[lat_axis]
+        wgts = ext.get_grid(coords[lat_dim])['coslat'][slices[lat_axis]]
+        wgts = np.broadcast_to(wgts.reshape(shape), view.shape)
+
+    if np.ma.isMaskedArray(view) or wgts is not None:
+        avg = np.ma.average(view, axis=axis, weights=wgts)
+    else:
+        avg = np.mean(view, axis=axis)
 
-    :param data: (np.array) - array of data
+    if da is not None:
+        kept = [dim for i, dim in enumerate(dims) if i not in axis]
+        kept_coords = {dim: np.asarray(coords[dim])[slices[dims.index(dim)]]
+                       for dim in kept if dim in coords}
+        avg = xr.DataArray(avg, dims=kept, coords=kept_coords,
+                           name=da.name, attrs=da.attrs)
+    return avg
+
+
+def _get_stream_stats(data, chunk=None, sketch_size=100000, seed=0):
+    """
+    Computes length, min, max, mean and std in one pass over chunks using
+    Chan/Welford merges, keeping a reservoir sample for quantiles. Like the
+    eager np.min/np.max, a NaN makes every stat NaN; no data gives NaNs.
+
+    :param data: (iterator/np.array) - iterator of chunks or (memmap) array
+    :param chunk: (int) - number of leading indices to read at once;
+                          about a million values at a time if None
+    :param sketch_size: (int) - max number of values kept for quantiles
+    :param seed: (int) - seed of the reservoir sampling
+    :return leng, mini, maxi, avg, std, sample: \
+        (int, float, float, float, float, np.array) - stats and sample
+    """
+    if hasattr(data, '__next__'):
+        blocks = data
+    else:
+        if chunk is None:
+            chunk = max(1, int(1e6 // max(np.prod(np.shape(data)[1:]), 1)))
+        blocks = (data[slc] for slc in _iter_chunks(len(data), chunk))
+
+    rng = np.random.RandomState(seed)
+    sample = np.empty(sketch_size)
+    leng, mini, maxi, avg, m2 = 0, np.inf, -np.inf, 0., 0.
+    for block in blocks:
+        block = np.asarray(block, dtype=float).ravel()
+        if block.size == 0:
+            continue
+        block_avg = block.mean()
+        block_m2 = np.square(block - block_avg).sum()
+        delta = block_avg - avg
+        total = leng + block.size
+        avg += delta * block.size / total
+        m2 += block_m2 + delta ** 2 * leng * block.size / total
+        mini = np.minimum(mini, block.min())
+        maxi = np.maximum(maxi, block.max())
+        sample = ext.update_sample(sample, block, leng, rng)
+        leng = total
+
+    if leng == 0:
+        return leng, np.nan, np.nan, np.nan, np.nan, sample[:0]
+    return (leng, mini, maxi, avg, np.sqrt(m2 / leng),
+            sample[:min(leng, sketch_size)])
+
+
+def get_stats(data, show=True, return_str='vertical',
+              stream=False, chunk=None, sketch_size=100000, pcts=None):
+    """
+    Get basic stats of an array. If streaming, min/max/avg/std are found
+    in a single pass and the median/percentiles from a reservoir sample
+    (exact if there are no more than sketch_size values).
+
+    :param data: (np.array/iterator) - array of data or iterator of chunks
     :param show: (boolean) - whether to print out stats
     :param return_str: (str) - indicator of to return vert, hori, or none str
+    :param stream: (boolean) - whether to stream; implied by chunk/iterator
+    :param chunk: (int) - number of leading indices to read at once
+    :param sketch_size: (int) - max number of values kept for quantiles
+    :param pcts: (list) - additional percentiles to report
     :return vert_format: (str) - vertically formatted string
     :return hori_format: (str) - horizontally formatted string
     :return leng, mini, maxi, med, avg, std: (np.float64) - \
-        length, maximum, medium, average, standard deviation
+        length, maximum, medium, average, standard deviation \
+        (followed by the percentiles if pcts)
     """
-    if len(np.shape(data)) > 1:
-        data = np.array(data).ravel()
-        print('\nThe get_stats data was temporarily converted to 1D.')
-
-    leng = len(data)
-    mini = np.min(data)
-    maxi = np.max(data)
-    med = np.median(data)
-    avg = np.average(data)
-    std = np.std(data)
+    if stream or chunk is not None or hasattr(data, '__next__'):
+        leng, mini, maxi, avg, std, sample = _get_stream_stats(
+            data, chunk=chunk, sketch_size=sketch_size)
+        if np.isnan(mini):
+            sample = np.array([np.nan])
+        med = np.median(sample)
+        if pcts is not None:
+            pct_vals = np.percentile(sample, pcts)
+    else:
+        if len(np.shape(data)) > 1:
+            data = np.array(data).ravel()
+            print('\nThe get_stats data was temporarily converted to 1D.')
+
+        leng = len(data)
+        mini = np.min(data)
+        maxi = np.max(data)
+        med = np.median(data)
+        avg = np.average(data)
+        std = np.std(data)
+        if pcts is not None:
+            pct_vals = np.percentile(data, pcts)
 
     len_str = 'Len: {0:6}'.format(leng)
     avg_str = 'Avg: {0:6.2f}'.format(avg)
@@ -394,6 +1105,13 @@ def get_stats(data, show=True, return_str='vertical'):
                             avg=avg_str,
                             std=std_str)
 
+    if pcts is not None:
+        pct_strs = ['P{0:02g}: {1:6.2f}'.format(pct, pct_val)
+                    for pct, pct_val in zip(pcts, pct_vals)]
+        hori_format = hori_format.rstrip('\n') + ', ' + \
+            ', '.join('{0:12}'.format(pct_str)
+                      for pct_str in pct_strs) + '\n'
+
     vert_format = hori_format.replace(', ', '\n')
 
     if show:
@@ -403,22 +1121,48 @@ def get_stats(data, show=True, return_str='vertical'):
         return hori_format
     elif 'vertical' in return_str:
         return vert_format
+    elif pcts is not None:
+        return (leng, mini, maxi, med, avg, std) + tuple(pct_vals)
     else:
         return leng, mini, maxi, med, avg, std
 
 
-def get_counts(data, show=True, return_str=False):
+def get_counts(data, show=True, return_str=False, bins=None):
     """
-    Get count distribution of data.
+    Get count distribution of data. Small non-negative integers are
+    counted with np.bincount, strings/objects through pandas factorized
+    codes and everything else with np.unique.
 
     :param data: (np.array) - array of data
     :param show: (boolean) - whether to print out distribution
     :param return_str: (boolean) - whether to return formatted string
+    :param bins: (int/arr) - number of bins or bin edges to histogram into
     :return count_list: (list) - list of count names and values
     :return formatted: (str) - optional formatted string of count list
     """
-    count_list = sorted(Counter(data).items(), key=operator.itemgetter(0))
-    count_list.append(('total', len(data)))
+    arr = np.asarray(data)
+    if arr.ndim != 1:
+        arr = arr.ravel()
+
+    if bins is not None:
+        counts, edges = np.histogram(arr, bins=bins)
+        values = list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+    elif arr.dtype.kind in 'OUS':
+        codes, uniques = pd.factorize(arr, sort=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        values = np.asarray(uniques).tolist()
+    elif arr.dtype.kind in 'iub' and arr.size > 0 and \
+            arr.min() >= 0 and arr.max() <= max(arr.size, 2 ** 16):
+        counts = np.bincount(arr.astype(np.int64))
+        values = np.flatnonzero(counts)
+        counts = counts[values]
+        values = values.astype(arr.dtype).tolist()
+    else:
+        values, counts = np.unique(arr, return_counts=True)
+        values = values.tolist()
+
+    count_list = list(zip(values, counts.tolist()))
+    count_list.append(('total', len(arr)))
 
     formatted_str = []
 
@@ -438,15 +1182,54 @@ def get_counts(data, show=True, return_str=False):
         return count_list
 
 
-def get_corr(x, y):
+def get_corr(x, y, axis=0, chunk=None):
     """
     Get the Pearson's correlation coefficient and two tailed p-value.
+    If x or y has more than one dimension, correlates along axis for
+    every grid cell at once (a 1D x against every cell of y, or two
+    fields cell by cell), optionally chunk cells at a time. The maps
+    can be passed to vis.plot_map(corr, data2=pval,
+    stipple=[0, alpha / 2, alpha, 1]) to stipple significant cells.
 
     :param x: (scalar/arr) - values
     :param y: (scalar/arr) - values
-    :return corr, pval: (scalar, scalar) - correlation coefficient, p-value
+    :param axis: (int) - axis of time in the N-D inputs
+    :param chunk: (int) - number of grid cells to correlate at once
+    :return corr, pval: (scalar/arr, scalar/arr) - correlation coefficient,
+                                                   p-value
     """
-    return pearsonr(x, y)
+    if np.ndim(x) <= 1 and np.ndim(y) <= 1:
+        return pearsonr(x, y)
+
+    if np.ndim(x) > np.ndim(y):
+        x, y = y, x
+    y = np.moveaxis(np.ma.filled(y, np.nan), axis, 0)
+    map_shp = y.shape[1:]
+    len_arr = y.shape[0]
+    y = y.reshape(len_arr, -1)
+    if np.ndim(x) > 1:
+        x = np.moveaxis(np.ma.filled(x, np.nan), axis, 0)
+        x = x.reshape(len_arr, -1)
+    else:
+        x = np.ma.filled(np.asarray(x, dtype=float), np.nan)[:, None]
+
+    corr = np.zeros(y.shape[1])
+    for slc in _iter_chunks(y.shape[1], chunk):
+        y_anom = np.asarray(y[:, slc], dtype=float)
+        y_anom = y_anom - y_anom.mean(axis=0)
+        x_anom = np.asarray(x[:, slc] if x.shape[1] > 1 else x, dtype=float)
+        x_anom = x_anom - x_anom.mean(axis=0)
+        numerator = np.sum(x_anom * y_anom, axis=0)
+        denominator = np.sum(np.square(x_anom), axis=0) * \
+            np.sum(np.square(y_anom), axis=0)
+        corr[slc] = numerator / np.sqrt(denominator)
+
+    corr = np.clip(corr, -1, 1)
+    dof = len_arr - 2
+    with np.errstate(divide='ignore'):
+        tstat = corr * np.sqrt(dof / (1 - np.square(corr)))
+    pval = 2 * t_dist.sf(np.abs(tstat), dof)
+    return corr.reshape(map_shp), pval.reshape(map_shp)
 
 
 def cosd(x):
@@ -520,27 +1303,164 @@ def get_c(a, b):
     return np.sqrt(a * a + b * b)
 
 
+def _get_cum_window(data, window, func):
+    """
+    Computes running min/max of every full window along the first axis in
+    linear time (van Herk/Gil-Werman block prefix and suffix scans).
+
+    :param data: (np.array) - data with length n + window - 1
+    :param window: (int) - size of the window
+    :param func: (np.ufunc) - np.maximum or np.minimum
+    :return reduced: (np.array) - reduced values with length n
+    """
+    len_out = data.shape[0] - window + 1
+    nblocks = -(-data.shape[0] // window)
+    pad = nblocks * window - data.shape[0]
+    padded = np.concatenate(
+        [data, np.full((pad,) + data.shape[1:], np.nan)]) if pad else data
+    blocks = padded.reshape((nblocks, window) + data.shape[1:])
+    prefix = func.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    suffix = suffix.reshape(padded.shape)
+    return func(suffix[:len_out], prefix[window - 1:window - 1 + len_out])
+
+
+def get_rolling(data, window=3, axis=0, how='mean',
+                center=False, wrap=False):
+    """
+    Computes a rolling mean, sum, min or max along any axis in linear time
+    using cumulative sums or block scans rather than copies of each window.
+    Like xarray, a value is labeled at the window's end (or center) and
+    windows with missing values are NaN, unless wrap treats the axis as
+    cyclic (e.g. DJF from a 12 month climatology).
+
+    :param data: (arr/xr.DataArray) - data values
+    :param window: (int) - size of the window
+    :param axis: (int/str) - axis (or dim name) to roll along
+    :param how: (str) - mean, sum, min, or max
+    :param center: (boolean) - whether to label at the window's center
+    :param wrap: (boolean) - whether to wrap around the axis' ends
+    :return rolled: (arr/xr.DataArray) - rolled values
+    """
+    da = None
+    if isinstance(data, xr.DataArray):
+        da = data
+        if not isinstance(axis, int):
+            axis = da.dims.index(axis)
+        data = da.values
+
+    arr = np.moveaxis(np.ma.filled(np.asarray(data, dtype=float), np.nan),
+                      axis, 0)
+    lead = window // 2 if center else window - 1
+    trail = window - 1 - lead
+    if wrap:
+        heads = [arr[arr.shape[0] - lead:]] if lead else []
+        tails = [arr[:trail]] if trail else []
+    else:
+        heads = [np.full((lead,) + arr.shape[1:], np.nan)]
+        tails = [np.full((trail,) + arr.shape[1:], np.nan)]
+    padded = np.concatenate(heads + [arr] + tails)
+
+    if how in ['mean', 'sum']:
+        nans = np.isnan(padded)
+        zeros = np.zeros((1,) + arr.shape[1:])
+        cum_sum = np.concatenate([zeros, np.cumsum(np.where(nans, 0, padded),
+                                                   axis=0)])
+        cum_nan = np.concatenate([zeros, np.cumsum(nans, axis=0)])
+        rolled = cum_sum[window:] - cum_sum[:-window]
+        rolled[(cum_nan[window:] - cum_nan[:-window]) > 0] = np.nan
+        if how == 'mean':
+            rolled /= window
+    elif how == 'max':
+        rolled = _get_cum_window(padded, window, np.maximum)
+    elif how == 'min':
+        rolled = _get_cum_window(padded, window, np.minimum)
+    else:
+        raise ValueError('how must be mean, sum, min, or max!')
+
+    rolled = np.moveaxis(rolled, 0, axis)
+    if da is not None:
+        return da.copy(data=rolled)
+    return rolled
+
+
 def get_terc_avg(data):
     """
     Get rolling seasonal terciles
 
-    :param a: (scalar) - value
-    :param b: (scalar) - value
-    :return c: (scalar) - value
+    :param data: (arr) - data values
+    :return terc_avg: (arr) - three step trailing averages
     """
-    return xr.DataArray(data).rolling(dim_0=3).mean().values
+    return get_rolling(data, window=3, how='mean')
 
 
-def get_regression(x, y=None, deg=1, **kwargs):
+def get_regression(x, y=None, deg=1, axis=0, chunk=None,
+                   coefs=False, fitted=True, **kwargs):
     """
-    Wrapper of np.polyfit to create regressions
+    Wrapper of np.polyfit to create regressions. If y has more than one
+    dimension, every grid cell is fit at once against a shared Vandermonde
+    matrix of the centered and scaled x (so the fit stays well conditioned
+    like np.polyfit's); NaN-masked cells are solved through batched normal
+    equations and coefficients are converted back to powers of x.
 
     :param x: (arr) - x values
-    :param y: (arr) - y values
+    :param y: (arr) - y values, optionally N-D with x along axis
     :param deg: (int) - degree of fitting polynomial
+    :param axis: (int) - axis of y that x runs along
+    :param chunk: (int) - number of grid cells to fit at once
+    :param coefs: (boolean) - whether to return the coefficients
+                              (highest power first, like np.polyfit)
+    :param fitted: (boolean) - whether to return the fitted values
+    :return coefs, fitted: (arr, arr) - coefficients and/or fitted values
     """
     if y is None:
         y = x
-        x = range(len(x))
-    pfit = np.poly1d(np.polyfit(x, y, deg, **kwargs))
-    return pfit(x)
+        x = range(np.shape(x)[axis])
+
+    if np.ndim(y) <= 1:
+        pcoefs = np.polyfit(x, y, deg, **kwargs)
+        pfit = np.poly1d(pcoefs)(x)
+        if coefs and fitted:
+            return pcoefs, pfit
+        return pcoefs if coefs else pfit
+
+    y = np.moveaxis(np.ma.filled(y, np.nan), axis, 0)
+    map_shp = y.shape[1:]
+    len_arr = y.shape[0]
+    y = y.reshape(len_arr, -1)
+    x = np.asarray(x, dtype=float)
+    x_mean = x.mean()
+    x_std = x.std() or 1.
+    vander = np.vander((x - x_mean) / x_std, deg + 1)
+
+    pcoefs = np.full((deg + 1, y.shape[1]), np.nan)
+    for slc in _iter_chunks(y.shape[1], chunk):
+        y_chunk = np.asarray(y[:, slc], dtype=float)
+        valid = ~np.isnan(y_chunk)
+        full = valid.all(axis=0)
+        chunk_coefs = np.full((deg + 1, y_chunk.shape[1]), np.nan)
+        if full.any():
+            chunk_coefs[:, full] = np.linalg.lstsq(
+                vander, y_chunk[:, full], rcond=None)[0]
+        part = ~full & (valid.sum(axis=0) > deg)
+        if part.any():
+            part_valid = valid[:, part].astype(float)
+            lhs = np.einsum('tc,ti,tj->cij', part_valid, vander, vander)
+            rhs = vander.T.dot(np.where(valid[:, part],
+                                        y_chunk[:, part], 0))
+            chunk_coefs[:, part] = np.linalg.solve(
+                lhs, rhs.T[:, :, None])[:, :, 0].T
+        pcoefs[:, slc] = chunk_coefs
+
+    pfit = np.moveaxis(vander.dot(pcoefs).reshape((len_arr,) + map_shp),
+                       0, axis) if fitted else None
+    if coefs:
+        unscale = np.zeros((deg + 1, deg + 1))
+        for power in range(deg + 1):
+            unscale[:power + 1, power] = np.polynomial.polynomial.polypow(
+                [-x_mean / x_std, 1. / x_std], power)
+        pcoefs = unscale[::-1, ::-1].dot(pcoefs)
+    pcoefs = pcoefs.reshape((deg + 1,) + map_shp)
+    if coefs and fitted:
+        return pcoefs, pfit
+    return pcoefs if coefs else pfit
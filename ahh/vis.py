@@ -1,5 +1,6 @@
 import os
 import copy
+import weakref
 import datetime
 import numpy as np
 import xarray as xr
@@ -39,6 +40,8 @@ DEFAULT = {
           'scale': 1,
           'projection': None,
           'dpi': 105,
+          'quantile_sample': None,
+          'quantile_cache': False,
           'sizes': {
                     'figure': {'smallest': 6,
                                'smaller': 9,
@@ -198,6 +201,8 @@ DEFAULT = {
     }
 
 SIZES = DEFAULT['sizes']
+QUANTILE_PCTS = [5, 7.5, 10, 95, 97.5]
+QUANTILE_CACHE = {}
 STYLES = DEFAULT['styles']
 COLORS = STYLES['color']
 ALPHAS = STYLES['alpha']
@@ -575,12 +580,14 @@ def plot_map(data, lats=None, lons=None, figsize=None, ax=None, stipple=None,
             if tick_locs is None:
                 tick_locs = contourf
         except:
-            base, base2 = _get_bases_logic(data)
+            quantiles = _get_quantiles_logic(data)
+            base, base2 = _get_bases_logic(data, quantiles=quantiles)
             vmin, vmax = _get_vmin_vmax_logic(data=data,
                                               base=base2,
                                               vmin=vmin,
                                               vmax=vmax,
-                                              data_lim=data_lim)
+                                              data_lim=data_lim,
+                                              quantiles=quantiles)
             vmin, vmax = _balance_logic(balance, vmin, vmax)
 
         if interval is None:
@@ -618,12 +625,14 @@ def plot_map(data, lats=None, lons=None, figsize=None, ax=None, stipple=None,
                          vmin=vmin, vmax=vmax, **kwargs)
         drawedges = True
     else:
-        base, base2 = _get_bases_logic(data)
+        quantiles = _get_quantiles_logic(data)
+        base, base2 = _get_bases_logic(data, quantiles=quantiles)
         vmin, vmax = _get_vmin_vmax_logic(data=data,
                                           base=base2,
                                           vmin=vmin,
                                           vmax=vmax,
-                                          data_lim=data_lim)
+                                          data_lim=data_lim,
+                                          quantiles=quantiles)
 
         vmin, vmax = _balance_logic(balance, vmin, vmax)
 
@@ -1154,10 +1163,12 @@ def plot_scatter(x, y=None, figsize=None, ax=None,
                                    projection=projection)
 
     if c is not None:
-        base, base2 = _get_bases_logic(c)
+        quantiles = _get_quantiles_logic(c)
+        base, base2 = _get_bases_logic(c, quantiles=quantiles)
         vmin, vmax = _get_vmin_vmax_logic(data=c, base=base2,
                                           vmin=vmin, vmax=vmax,
-                                          data_lim=data_lim)
+                                          data_lim=data_lim,
+                                          quantiles=quantiles)
 
         oom = get_order_mag(vmax - vmin)
         interval = _get_interval_logic(interval=interval,
@@ -1463,12 +1474,14 @@ def plot_heatmap(df, figsize=None, ax=None, mask=None, mask2=None,
     if ax is None:
         ax = plt.subplot(rows, cols, pos)
 
-    base, base2 = _get_bases_logic(df)
+    quantiles = _get_quantiles_logic(df)
+    base, base2 = _get_bases_logic(df, quantiles=quantiles)
     vmin, vmax = _get_vmin_vmax_logic(data=df,
                                       base=base2,
                                       vmin=vmin,
                                       vmax=vmax,
-                                      data_lim=data_lim)
+                                      data_lim=data_lim,
+                                      quantiles=quantiles)
     oom = get_order_mag(vmax - vmin)
     interval = _get_interval_logic(interval=interval,
                                    vmin=vmin, vmax=vmax,
@@ -3978,13 +3991,56 @@ def _get_ax_logic(ax=None, twinx=None, twiny=None,
     return ax, rows, cols
 
 
-def _get_bases_logic(data=None):
+def _get_quantiles_logic(data=None):
+    # one percentile pass shared by the bases, vmin/vmax and balance logic;
+    # DEFAULT['quantile_sample'] subsamples large arrays and
+    # DEFAULT['quantile_cache'] reuses results for the same (unmodified)
+    # array across redraws
     if isinstance(data, pd.DataFrame):
         data = data.values
 
+    use_cache = DEFAULT['quantile_cache']
+    if use_cache:
+        cached = QUANTILE_CACHE.get(id(data))
+        if cached is not None and cached[0]() is data:
+            return cached[1]
+
+    sample = data
+    sample_size = DEFAULT['quantile_sample']
+    if sample_size is not None and np.size(data) > sample_size:
+        sample = np.ravel(data)
+        sample = sample[::int(np.ceil(sample.size / float(sample_size)))]
+
     try:
-        maxmin_diff = (np.percentile(data, 95) -
-                       np.abs(np.percentile(data, 5))
+        try:
+            values = np.percentile(sample, QUANTILE_PCTS)
+        except ValueError:
+            values = np.nanpercentile(sample, QUANTILE_PCTS)
+    except Exception:
+        return None
+    quantiles = dict(zip(QUANTILE_PCTS, values))
+
+    if use_cache:
+        try:
+            data_id = id(data)
+            ref = weakref.ref(data,
+                              lambda ref: QUANTILE_CACHE.pop(data_id, None))
+            QUANTILE_CACHE[data_id] = (ref, quantiles)
+        except TypeError:
+            pass
+    return quantiles
+
+
+def _get_bases_logic(data=None, quantiles=None):
+    if isinstance(data, pd.DataFrame):
+        data = data.values
+
+    if quantiles is None:
+        quantiles = _get_quantiles_logic(data)
+
+    try:
+        maxmin_diff = (quantiles[95] -
+                       np.abs(quantiles[5])
                        )
     except:
         maxmin_diff = np.max(data) - np.abs(np.min(data))
@@ -4012,32 +4068,29 @@ def _get_bases_logic(data=None):
 
 def _get_vmin_vmax_logic(data=None, base=1,
                          vmin=None, vmax=None,
-                         data_lim=None):
+                         data_lim=None, quantiles=None):
     if isinstance(data, pd.DataFrame):
         data = data.values
 
     if data_lim is None:
+        # only given vmin and vmax that differ skip the percentiles
+        if quantiles is None and (vmin is None or vmax is None or
+                                  vmin == vmax):
+            quantiles = _get_quantiles_logic(data)
+            if quantiles is None:
+                quantiles = dict(zip(QUANTILE_PCTS,
+                                     np.nanpercentile(data, QUANTILE_PCTS)))
         if vmin is None:
-            try:
-                vmin = round_to(np.percentile(data, 7.5),
-                                prec=5,
-                                base=base)
-            except ValueError:
-                vmin = round_to(np.nanpercentile(data, 7.5),
-                                prec=5,
-                                base=base)
+            vmin = round_to(quantiles[7.5],
+                            prec=5,
+                            base=base)
         if vmax is None:
-            try:
-                vmax = round_to(np.percentile(data, 97.5),
-                                prec=5,
-                                base=base)
-            except ValueError:
-                vmax = round_to(np.nanpercentile(data, 97.5),
-                                prec=5,
-                                base=base)
+            vmax = round_to(quantiles[97.5],
+                            prec=5,
+                            base=base)
         if vmin == vmax:
-            vmin = np.percentile(data, 10)
-            vmax = np.percentile(data, 97.5)
+            vmin = quantiles[10]
+            vmax = quantiles[97.5]
     else:
         vmin = data_lim[0]
         vmax = data_lim[1]
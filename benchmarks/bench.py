@@ -0,0 +1,345 @@
+"""
+Standalone benchmarks of the sci/ext/era hot paths on synthetic data.
+
+Usage (from the repository root):
+    python benchmarks/bench.py                      # small and medium sizes
+    python benchmarks/bench.py --sizes large archive --filter get_cac
+    python benchmarks/bench.py --save               # write the baseline
+    python benchmarks/bench.py --compare            # flag regressions
+
+Each benchmark is timed as the best of --repeat calls (after one warm up
+call) and, unless --no-memory, its tracemalloc peak is measured in a
+separate call so that tracing does not skew the timings. Results are
+written as JSON; comparing against a baseline flags every case that got
+slower (or used more memory) than --tolerance and exits with status 1.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+from ahh import sci, ext, era  # noqa: E402
+
+__author__ = 'huang.andrew12@gmail.com'
+__copyright__ = 'Andrew Huang'
+
+THIS_DIR = os.path.dirname(os.path.realpath(__file__))
+BASELINE = os.path.join(THIS_DIR, 'baseline.json')
+
+SIZES = {'small': {'ntimes': 30, 'nlats': 19, 'nlons': 36},
+         'medium': {'ntimes': 365, 'nlats': 91, 'nlons': 180},
+         'large': {'ntimes': 1460, 'nlats': 181, 'nlons': 360},
+         'archive': {'ntimes': 3650, 'nlats': 361, 'nlons': 720},
+         }
+
+BENCHMARKS = {}
+
+
+def benchmark(function):
+    """
+    Registers a setup function; it's given a size dict and returns the
+    function to time (called without arguments).
+
+    :param function: (function) - setup function
+    :return function: (function) - the same setup function
+    """
+    BENCHMARKS[function.__name__.replace('bench_', '')] = function
+    return function
+
+
+def _get_grid(ntimes, nlats, nlons, seed=0):
+    """
+    Makes a synthetic (time, lat, lon) field with a seasonal cycle.
+
+    :param ntimes: (int) - number of daily time steps
+    :param nlats: (int) - number of latitudes
+    :param nlons: (int) - number of longitudes
+    :param seed: (int) - seed of the noise
+    :return data, times, lats, lons: (np.array x4) - field and coordinates
+    """
+    rng = np.random.RandomState(seed)
+    times = pd.date_range('2000-01-01', periods=ntimes, freq='D')
+    lats = np.linspace(-90, 90, nlats)
+    lons = np.linspace(0, 360, nlons, endpoint=False)
+    cycle = np.cos(2 * np.pi * times.dayofyear.values / 365.25)
+    data = (cycle[:, None, None] * np.cos(np.deg2rad(lats))[:, None] +
+            rng.standard_normal((ntimes, nlats, nlons)))
+    return data, times, lats, lons
+
+
+@benchmark
+def bench_get_cac(size):
+    data, times, lats, lons = _get_grid(**size)
+    fcst = data + 0.5 * np.random.RandomState(1).standard_normal(data.shape)
+    clim = data.mean(axis=0)
+    return lambda: sci.get_cac(data, fcst, clim)
+
+
+@benchmark
+def bench_get_cac_regions(size):
+    data, times, lats, lons = _get_grid(**size)
+    fcst = data + 0.5 * np.random.RandomState(1).standard_normal(data.shape)
+    clim = data.mean(axis=0)
+    idc = [ext.get_idc(lats, lons, lower, lower + 30, 0, 180)
+           for lower in (-90, -60, -30, 0, 30, 60)]
+    return lambda: sci.get_cac(data, fcst, clim, idc=idc)
+
+
+@benchmark
+def bench_get_avg(size):
+    data, times, lats, lons = _get_grid(**size)
+    return lambda: sci.get_avg(data, axis=(1, 2))
+
+
+@benchmark
+def bench_get_avg_weighted(size):
+    data, times, lats, lons = _get_grid(**size)
+    lats_idc = ext.get_idc(lats, lons, -30, 30, 0, 360)[0]
+    return lambda: sci.get_avg(data, axis=(1, 2), lats_idc=lats_idc,
+                               coords={'lat': lats}, weight=True)
+
+
+@benchmark
+def bench_get_idc(size):
+    lats = np.linspace(-90, 90, size['nlats'])
+    lons = np.linspace(0, 360, size['nlons'], endpoint=False)
+    return lambda: ext.get_idc(lats, lons, -20, 45, 100, 300)
+
+
+@benchmark
+def bench_get_spells(size):
+    data, times, lats, lons = _get_grid(**size)
+    return lambda: ext.get_spells(data > 1, axis=0, min_length=3)
+
+
+@benchmark
+def bench_time2dt(size):
+    ntimes = size['ntimes'] * 24
+    times = pd.date_range('2000-01-01', periods=ntimes, freq='h')
+    time_strs = np.array(times.strftime('%Y-%m-%d %H:%M'))
+    return lambda: era.time2dt(time_strs, strf='%Y-%m-%d %H:%M')
+
+
+@benchmark
+def bench_time2dt_infer(size):
+    ntimes = size['ntimes'] * 24
+    times = pd.date_range('2000-01-01', periods=ntimes, freq='h')
+    time_strs = np.array(times.strftime('%Y-%m-%d %H:%M'))
+    return lambda: era.time2dt(time_strs)
+
+
+@benchmark
+def bench_time2dt_ymd(size):
+    ntimes = size['ntimes'] * 24
+    times = pd.date_range('2000-01-01', periods=ntimes, freq='h')
+    return lambda: era.time2dt(strf=None, year=times.year.values,
+                               month=times.month.values,
+                               day=times.day.values,
+                               hour=times.hour.values)
+
+
+@benchmark
+def bench_dt2seas(size):
+    times = pd.date_range('2000-01-01', periods=size['ntimes'] * 24,
+                          freq='h')
+    return lambda: era.dt2seas(times)
+
+
+@benchmark
+def bench_dt2seas_three(size):
+    times = pd.date_range('2000-01-01', periods=size['ntimes'] * 24,
+                          freq='h')
+    return lambda: era.dt2seas(times, four=False)
+
+
+def time_it(function, repeat=5):
+    """
+    Times a function as the best of repeat calls after a warm up call.
+
+    :param function: (function) - function without arguments
+    :param repeat: (int) - number of timed calls
+    :return best, median: (float, float) - seconds taken
+    """
+    function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        times.append((time.perf_counter_ns() - start) / 1e9)
+    return min(times), float(np.median(times))
+
+
+def peak_it(function):
+    """
+    Measures the tracemalloc peak (in MB) of a single call.
+
+    :param function: (function) - function without arguments
+    :return peak: (float) - peak of allocated memory during the call
+    """
+    started = tracemalloc.is_tracing()
+    if not started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        if not started:
+            tracemalloc.stop()
+    return peak / 1e6
+
+
+def run(names=None, sizes=('small', 'medium'), repeat=5, memory=True,
+        show=True):
+    """
+    Runs the registered benchmarks.
+
+    :param names: (list) - substrings of benchmarks to run; None for all
+    :param sizes: (list) - keys of SIZES to run
+    :param repeat: (int) - number of timed calls per case
+    :param memory: (boolean) - whether to measure peak memory
+    :param show: (boolean) - whether to print each result
+    :return results: (dict) - case: {best_s, median_s, peak_mb} or error
+    """
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(sub in name for sub in names):
+            continue
+        for size in sizes:
+            case = '{0}[{1}]'.format(name, size)
+            try:
+                function = setup(SIZES[size])
+                best, median = time_it(function, repeat=repeat)
+                result = {'best_s': best, 'median_s': median}
+                if memory:
+                    result['peak_mb'] = peak_it(function)
+            except Exception as e:
+                result = {'error': '{0}: {1}'.format(type(e).__name__, e)}
+            results[case] = result
+            if show:
+                if 'error' in result:
+                    print('{0:<36} {1}'.format(case, result['error']))
+                else:
+                    print('{0:<36} {1:>10.6f} s {2:>10.2f} MB'
+                          .format(case, result['best_s'],
+                                  result.get('peak_mb', np.nan)))
+    return results
+
+
+def get_meta():
+    """
+    Describes the machine and versions the benchmarks were run on.
+
+    :return meta: (dict) - machine/version info
+    """
+    return {'date': pd.Timestamp.now(tz='UTC').isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'node': platform.node()}
+
+
+def compare(results, baseline, tolerance=0.25, show=True):
+    """
+    Compares results against a baseline.
+
+    :param results: (dict) - output of run()
+    :param baseline: (dict) - stored results of run()
+    :param tolerance: (float) - allowed fractional slow down/memory growth
+    :return regressions: (list) - cases that regressed
+    """
+    regressions = []
+    for case, result in results.items():
+        old = baseline.get(case)
+        if old is None or 'error' in result or 'error' in old:
+            continue
+        ratio = result['best_s'] / old['best_s']
+        flags = []
+        if ratio > 1 + tolerance:
+            flags.append('SLOWER')
+        elif ratio < 1 / (1 + tolerance):
+            flags.append('faster')
+        if 'peak_mb' in result and 'peak_mb' in old:
+            if result['peak_mb'] > (1 + tolerance) * old['peak_mb'] + 0.1:
+                flags.append('MORE MEMORY')
+        if 'SLOWER' in flags or 'MORE MEMORY' in flags:
+            regressions.append(case)
+        if show:
+            print('{0:<36} {1:>6.2f}x {2}'.format(case, ratio,
+                                                  ' '.join(flags)))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', nargs='+', default=['small', 'medium'],
+                        choices=list(SIZES))
+    parser.add_argument('--filter', nargs='+', default=None,
+                        help='substrings of benchmark names to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write the results to')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true',
+                        help='write the results as the baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='flag regressions against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--list', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print('\n'.join(BENCHMARKS))
+        return 0
+
+    results = run(names=args.filter, sizes=args.sizes, repeat=args.repeat,
+                  memory=not args.no_memory)
+    report = {'meta': get_meta(), 'results': results}
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    status = 0
+    if args.compare:
+        if not os.path.isfile(args.baseline):
+            print('No baseline at {0}; run with --save first!'
+                  .format(args.baseline))
+        else:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            print('')
+            regressions = compare(results, baseline['results'],
+                                  tolerance=args.tolerance)
+            if regressions:
+                print('\n{0} regression(s): {1}'
+                      .format(len(regressions), ', '.join(regressions)))
+                status = 1
+
+    if args.save:
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+            stored['results'].update(results)
+            stored['meta'] = report['meta']
+            report = stored
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print('Saved baseline to {0}'.format(args.baseline))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())